@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from app.core.config import settings
+
+
+# -------------------------------------------
+# CACHE PERSISTENTE DE COMPLETIONS DO LLM
+# -------------------------------------------
+# Mesmo prompt (mesma pergunta + mesmas tabelas) => mesma resposta, sem ir
+# ao Ollama. SQLite em modo WAL: seguro entre os workers do uvicorn e
+# sobrevive a restarts.
+#
+# Chave: sha256(modelo + opções de geração + system + prompt + modo).
+# Invalidação: TTL por entrada e LRU por tamanho total (settings).
+# Bypass: LLM_CACHE_ENABLED=0, purposes fora de LLM_CACHE_PURPOSES ou
+# cache=False na chamada.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    purpose TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used);
+"""
+
+
+def completion_key(model: str, prompt: str, options: dict, mode: str = "full") -> str:
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "options": options, "mode": mode},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, path, ttl=86400, max_mb=256, purposes=("sql",)):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_mb * 1024 * 1024
+        self.purposes = set(purposes)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._local = threading.local()  # uma conexão sqlite por thread
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    # ---------------------------
+    # Conexão
+    # ---------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def enabled_for(self, purpose: str) -> bool:
+        return settings.llm_cache_enabled and purpose in self.purposes
+
+    # ---------------------------
+    # API pública
+    # ---------------------------
+    def get(self, key: str):
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT response, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+        except sqlite3.Error as e:
+            print(f"[WARN] Cache de completions indisponível: {e}")
+            return None
+
+    def put(self, key: str, model: str, purpose: str, response: str):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, purpose, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, purpose, response, size, now, now)
+            )
+
+            # evicção a cada 50 inserções (evita somar a tabela a todo put)
+            with self._lock:
+                self._puts += 1
+                check = self._puts % 50 == 1
+            if check:
+                self._evict(conn, now)
+
+        except sqlite3.Error as e:
+            print(f"[WARN] Falha ao gravar no cache de completions: {e}")
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # remove os menos usados recentemente até caber no limite
+        excess = total - self.max_bytes
+        removed = 0
+        for key, size in conn.execute(
+            "SELECT key, size FROM completions ORDER BY last_used ASC"
+        ).fetchall():
+            if removed >= excess:
+                break
+            conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            removed += size
+
+    def clear(self) -> int:
+        conn = self._conn()
+        return conn.execute("DELETE FROM completions").rowcount
+
+    def stats(self) -> dict:
+        try:
+            entries, size = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        except sqlite3.Error:
+            entries, size = 0, 0
+
+        return {
+            "enabled": settings.llm_cache_enabled,
+            "purposes": sorted(self.purposes),
+            "entries": entries,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "hits": self.hits,      # deste processo
+            "misses": self.misses
+        }
+
+
+completion_cache = CompletionCache(
+    settings.llm_cache_path,
+    ttl=settings.llm_cache_ttl,
+    max_mb=settings.llm_cache_max_mb,
+    purposes=settings.llm_cache_purposes
+)
@@ -1,42 +1,123 @@
-import requests
 import re
 from app.core.config import settings
+from app.agents.llm.ollama_client import get_client, run_sync, iterate_sync
+from app.agents.llm.completion_cache import completion_cache, completion_key
+from app.core.concurrency import run_in_stage
 
 LLAMA_URL = f"{settings.llama_server}/api/generate"
-MODEL_NAME = "llama3.1"
+MODEL_NAME = settings.llm_model
 
 
-def call_llama_generate(prompt: str) -> str:
-    try:
-        response = requests.post(
-            LLAMA_URL,
-            json={
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "stream": False
-            },
-            timeout=300
-        )
-    except requests.exceptions.RequestException as e:
-        raise RuntimeError(f"Erro ao conectar ao servidor LLM: {e}")
-
-    # valida status HTTP
-    if response.status_code != 200:
-        raise RuntimeError(f"Ollama retornou HTTP {response.status_code}: {response.text}")
-
-    # tenta decodificar JSON
-    try:
-        data = response.json()
-    except Exception as e:
-        raise RuntimeError(f"Erro ao interpretar JSON da resposta do LLM: {e}")
+def _clean_response(raw: str) -> str:
+    # limpeza mínima (a limpeza pesada é no sql_generator)
+    raw = re.sub(r"```.*?```", "", raw, flags=re.DOTALL)
+    raw = raw.replace("`", "")
+
+    return raw.strip()
+
+
+async def _cache_lookup(prompt: str, purpose: str, options: dict, mode: str, cache: bool):
+    """(chave, resposta em cache) — chave None quando o cache não se aplica."""
+    if not cache or not completion_cache.enabled_for(purpose):
+        return None, None
+
+    key = completion_key(MODEL_NAME, prompt, options, mode)
+    return key, await run_in_stage("llm_cache", completion_cache.get, key)
+
+
+async def _cache_store(key, purpose: str, response: str):
+    if key is not None:
+        await run_in_stage("llm_cache", completion_cache.put, key, MODEL_NAME, purpose, response)
+
+
+# -------------------------------------------
+# API ASSÍNCRONA (event loop da API)
+# -------------------------------------------
+async def acall_llama_generate(prompt: str, purpose: str = "generic", timeout=None, cache=True, **options) -> str:
+    key, cached = await _cache_lookup(prompt, purpose, options, "full", cache)
+    if cached is not None:
+        return cached
+
+    data = await get_client().generate(prompt, purpose=purpose, timeout=timeout, **options)
 
     # extrai conteúdo
     raw = data.get("response")
     if not raw:
         raise RuntimeError("LLM retornou resposta vazia ou inválida.")
 
-    # limpeza mínima (a limpeza pesada é no sql_generator)
-    raw = re.sub(r"```.*?```", "", raw, flags=re.DOTALL)
-    raw = raw.replace("`", "")
+    response = _clean_response(raw)
+    await _cache_store(key, purpose, response)
+    return response
+
+
+async def astream_llama_generate(prompt: str, purpose: str = "generic", timeout=None, **options):
+    """
+    Versão em streaming ("stream": true): gera os tokens conforme o
+    Ollama devolve cada linha NDJSON.
+    """
+    async for chunk in get_client().stream(prompt, purpose=purpose, timeout=timeout, **options):
+        token = chunk.get("response")
+        if token:
+            yield token
+
+
+async def acall_llama_generate_until(prompt: str, stop_when, purpose: str = "generic", timeout=None, cache=True, **options) -> str:
+    """
+    Gera em streaming e para de ler assim que stop_when(texto_acumulado)
+    for verdadeiro (ex.: SQL já completo) — o Ollama deixa de gerar os
+    tokens que seriam descartados depois.
+    """
+    # a resposta truncada depende do critério de parada: entra na chave
+    mode = f"until:{getattr(stop_when, '__name__', 'custom')}"
+    key, cached = await _cache_lookup(prompt, purpose, options, mode, cache)
+    if cached is not None:
+        return cached
+
+    parts = []
+    stream = astream_llama_generate(prompt, purpose=purpose, timeout=timeout, **options)
+    try:
+        async for token in stream:
+            parts.append(token)
+            if stop_when("".join(parts)):
+                break
+    finally:
+        await stream.aclose()
+
+    raw = "".join(parts)
+    if not raw:
+        raise RuntimeError("LLM retornou resposta vazia ou inválida.")
+
+    response = _clean_response(raw)
+    await _cache_store(key, purpose, response)
+    return response
+
+
+async def awarmup_llama():
+    """
+    Carrega o modelo no Ollama sem gerar nada (prompt vazio) e pede que
+    ele fique residente por settings.llama_keep_alive.
+    """
+    await get_client().generate("", purpose="warmup", keep_alive=settings.llama_keep_alive)
+
+
+# -------------------------------------------
+# FACHADA SÍNCRONA (threads, scripts, pipeline)
+# -------------------------------------------
+def call_llama_generate(prompt: str, purpose: str = "generic", timeout=None, cache=True, **options) -> str:
+    return run_sync(acall_llama_generate(prompt, purpose=purpose, timeout=timeout, cache=cache, **options))
+
+
+def call_llama_generate_until(prompt: str, stop_when, purpose: str = "generic", timeout=None, cache=True, **options) -> str:
+    return run_sync(
+        acall_llama_generate_until(prompt, stop_when, purpose=purpose, timeout=timeout, cache=cache, **options)
+    )
+
+
+def stream_llama_generate(prompt: str, purpose: str = "generic", timeout=None, **options):
+    yield from iterate_sync(
+        lambda: astream_llama_generate(prompt, purpose=purpose, timeout=timeout, **options)
+    )
+
 
-    return raw.strip()
\ No newline at end of file
+def warmup_llama():
+    run_sync(awarmup_llama())
@@ -0,0 +1,251 @@
+import json
+import time
+import random
+import asyncio
+import threading
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import observe_llm_response, observe_llm_stream
+
+
+# -------------------------------------------
+# CLIENTE ASSÍNCRONO DO OLLAMA
+# -------------------------------------------
+# Um único cliente para todas as chamadas ao LLM:
+#   - conexões HTTP persistentes (pool do httpx, sem handshake por chamada);
+#   - limite de chamadas simultâneas (settings.llm_max_concurrency);
+#   - timeouts de conexão/leitura por chamada;
+#   - até settings.llm_retries tentativas (mínimo 1) com backoff exponencial
+#     + jitter em falhas de rede, timeout e HTTP 5xx (erros 4xx não são
+#     repetidos). A vaga do semáforo é liberada durante a espera do backoff.
+# O código síncrono usa a fachada em llama_api (loop próprio em background).
+class LLMError(RuntimeError):
+    pass
+
+
+_RETRY_STATUS = {500, 502, 503, 504}
+
+
+class OllamaClient:
+    def __init__(self, base_url=None, max_concurrency=None, retries=None):
+        self.base_url = (base_url or settings.llama_server).rstrip("/")
+        # LLM_RETRIES é o total de tentativas; 0 ainda faz a chamada uma vez
+        self.attempts = max(1, settings.llm_retries if retries is None else retries)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency or settings.llm_max_concurrency))
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(settings.llm_read_timeout, connect=settings.llm_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_concurrency,
+                max_keepalive_connections=settings.llm_max_concurrency
+            )
+        )
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    # ---------------------------
+    # Infra
+    # ---------------------------
+    def _timeout(self, timeout):
+        if timeout is None:
+            return httpx.USE_CLIENT_DEFAULT
+        return httpx.Timeout(timeout, connect=settings.llm_connect_timeout)
+
+    async def _backoff(self, attempt: int, error):
+        delay = settings.llm_backoff_base * (2 ** (attempt - 1))
+        delay = random.uniform(0, delay)  # full jitter
+        print(f"[WARN] LLM falhou ({error}); tentativa {attempt}/{self.attempts}, nova em {delay:.1f}s...")
+        await asyncio.sleep(delay)
+
+    def _payload(self, prompt: str, stream: bool, options: dict) -> dict:
+        # keep_alive em toda chamada: o modelo (e o KV-cache do prefixo do
+        # prompt) continua carregado entre requisições
+        payload = {
+            "model": settings.llm_model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": settings.llama_keep_alive
+        }
+        payload.update({k: v for k, v in options.items() if v is not None})
+        return payload
+
+    # ---------------------------
+    # API
+    # ---------------------------
+    async def generate(self, prompt: str, purpose: str = "generic", timeout=None, **options) -> dict:
+        """POST /api/generate sem streaming; retorna o JSON completo do Ollama."""
+        payload = self._payload(prompt, False, options)
+
+        for attempt in range(1, self.attempts + 1):
+            # semáforo só durante a chamada: o backoff não ocupa vaga
+            async with self._semaphore:
+                try:
+                    response = await self._http.post("/api/generate", json=payload, timeout=self._timeout(timeout))
+                except httpx.HTTPError as e:
+                    if attempt == self.attempts:
+                        raise LLMError(f"Erro ao conectar ao servidor LLM: {e}")
+                    response, error = None, e
+                else:
+                    error = None
+
+            if response is not None and response.status_code in _RETRY_STATUS and attempt < self.attempts:
+                error = f"HTTP {response.status_code}"
+
+            if error is not None:
+                await self._backoff(attempt, error)
+                continue
+
+            if response.status_code != 200:
+                raise LLMError(f"Ollama retornou HTTP {response.status_code}: {response.text}")
+
+            try:
+                data = response.json()
+            except ValueError as e:
+                raise LLMError(f"Erro ao interpretar JSON da resposta do LLM: {e}")
+
+            observe_llm_response(purpose, data)
+            return data
+
+    async def stream(self, prompt: str, purpose: str = "generic", timeout=None, **options):
+        """
+        POST /api/generate com "stream": true; gera cada chunk NDJSON.
+        Só repete a chamada se a falha acontecer antes do primeiro chunk.
+        Fechar o gerador antes do fim encerra a conexão (o Ollama para de
+        gerar) e registra a chamada como parada antecipada.
+        """
+        payload = self._payload(prompt, True, options)
+        start = time.perf_counter()
+        first_token_at = None
+        tokens = 0
+        done = False
+
+        for attempt in range(1, self.attempts + 1):
+            started = False
+            error = None
+
+            # semáforo durante a chamada (e o streaming), liberado no backoff
+            async with self._semaphore:
+                try:
+                    async with self._http.stream(
+                        "POST", "/api/generate", json=payload, timeout=self._timeout(timeout)
+                    ) as response:
+                        if response.status_code != 200:
+                            body = (await response.aread()).decode(errors="replace")
+                            if response.status_code not in _RETRY_STATUS or attempt == self.attempts:
+                                raise LLMError(f"Ollama retornou HTTP {response.status_code}: {body}")
+                            error = f"HTTP {response.status_code}"
+                        else:
+                            async for line in response.aiter_lines():
+                                if not line:
+                                    continue
+
+                                try:
+                                    chunk = json.loads(line)
+                                except ValueError:
+                                    continue
+
+                                if chunk.get("error"):
+                                    raise LLMError(f"Erro do LLM: {chunk['error']}")
+
+                                started = True
+                                if chunk.get("response"):
+                                    tokens += 1
+                                    if first_token_at is None:
+                                        first_token_at = time.perf_counter()
+
+                                if chunk.get("done"):
+                                    done = True
+                                    observe_llm_response(purpose, chunk)
+
+                                yield chunk
+
+                                if done:
+                                    return
+                            done = True
+                            return
+
+                except httpx.HTTPError as e:
+                    if started or attempt == self.attempts:
+                        raise LLMError(f"Erro ao conectar ao servidor LLM: {e}")
+                    error = e
+
+                finally:
+                    if started or done:
+                        observe_llm_stream(
+                            purpose,
+                            None if first_token_at is None else first_token_at - start,
+                            tokens,
+                            time.perf_counter() - (first_token_at or start),
+                            early_stop=not done
+                        )
+
+            await self._backoff(attempt, error)
+
+
+# -------------------------------------------
+# UM CLIENTE POR EVENT LOOP
+# -------------------------------------------
+# O httpx.AsyncClient fica preso ao loop em que foi criado: a API usa o
+# loop do uvicorn e a fachada síncrona usa um loop próprio em background.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(loop)
+            if client is None:
+                client = OllamaClient()
+                _clients[loop] = client
+    return client
+
+
+async def close_client():
+    """Fecha o cliente do loop atual (shutdown da API)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+_sync_loop = None
+_sync_lock = threading.Lock()
+
+
+def _background_loop():
+    global _sync_loop
+
+    if _sync_loop is None:
+        with _sync_lock:
+            if _sync_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-sync-loop", daemon=True).start()
+                _sync_loop = loop
+    return _sync_loop
+
+
+def run_sync(coro):
+    """Executa a corrotina no loop de background e aguarda o resultado (fachada síncrona)."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def iterate_sync(agen_factory):
+    """
+    Consome um gerador assíncrono no loop de background, devolvendo os itens
+    de forma síncrona. Fechar o gerador síncrono fecha o assíncrono.
+    """
+    loop = _background_loop()
+    agen = agen_factory()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
@@ -0,0 +1,184 @@
+import sys
+import json
+import threading
+from types import MappingProxyType
+
+
+# -------------------------------------------
+# NORMALIZAÇÃO ROBUSTA DE METADADOS
+# -------------------------------------------
+
+def normalize_json_field(value):
+    """
+    Aceita:
+    - lista de dicts
+    - lista de strings JSON
+    - string contendo JSON
+    - None
+    Retorna SEMPRE: lista de dicts limpos
+    """
+    if value is None:
+        return []
+
+    # caso seja string JSON
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except:
+            return []
+
+    # caso seja lista
+    if isinstance(value, list):
+        clean = []
+        for item in value:
+            if isinstance(item, dict):
+                clean.append(item)
+            elif isinstance(item, str):
+                try:
+                    obj = json.loads(item)
+                    if isinstance(obj, dict):
+                        clean.append(obj)
+                except:
+                    pass
+        return clean
+
+    return []
+
+
+def normalize_string_list(value):
+    """Campo tags e glossary — podem ser string JSON ou lista."""
+    if value is None:
+        return []
+
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except:
+            return []
+
+    if isinstance(value, list):
+        return value
+
+    return []
+
+
+# -------------------------------------------
+# CATÁLOGO DE TABELAS EM MEMÓRIA
+# -------------------------------------------
+# Os metadados do Chroma (columns/tags/glossary_terms em JSON) são
+# decodificados uma única vez, quando a coleção é carregada. A busca
+# devolve referências a esses registros: nada de json.loads nem de
+# remontar mapas de colunas a cada requisição. Por isso os campos são
+# imutáveis (tuplas e MappingProxyType): nenhuma requisição altera o
+# catálogo compartilhado.
+class ColumnRecord:
+    __slots__ = ("name", "type", "lname", "ltype")
+
+    def __init__(self, name, type_):
+        self.name = sys.intern(name)
+        self.type = type_
+        self.lname = sys.intern(name.lower())
+        # tipo vazio = desconhecido (fix_type_mismatches não mexe na coluna)
+        self.ltype = sys.intern((type_ or "").lower())
+
+
+class TableRecord:
+    __slots__ = (
+        "id", "text", "schema", "table", "domain",
+        "columns", "column_dicts", "column_names", "column_types",
+        "pk", "tags", "glossary_terms"
+    )
+
+    def __init__(self, tid, doc, meta):
+        self.id = sys.intern(tid)
+        self.text = doc or ""
+        self.schema = meta.get("schema")
+        self.table = meta.get("table")
+        self.domain = meta.get("domain", "")
+
+        # NORMALIZAÇÃO 100% — remove erro de coluna inválida
+        cols = []
+        for c in normalize_json_field(meta.get("columns")):
+            name = c.get("name")
+            if isinstance(name, str) and name:
+                cols.append(ColumnRecord(name, c.get("type")))
+
+        self.columns = tuple(cols)
+        # formato original ({"name", "type"} por coluna), somente leitura
+        self.column_dicts = tuple(MappingProxyType({"name": c.name, "type": c.type}) for c in cols)
+        self.column_names = tuple(c.name for c in cols)
+        self.column_types = MappingProxyType({c.lname: c.ltype for c in cols})  # nome minúsculo -> tipo
+        # metadado do Chroma guarda a PK como "col1, col2"
+        pk = meta.get("pk") or ""
+        self.pk = tuple(p.strip() for p in pk.split(",") if p.strip()) if isinstance(pk, str) else tuple(pk)
+
+        self.tags = tuple(sys.intern(t) for t in normalize_string_list(meta.get("tags")) if isinstance(t, str))
+        self.glossary_terms = tuple(normalize_string_list(meta.get("glossary_terms")))
+
+    def as_result(self, score: float) -> dict:
+        """
+        Resultado da busca com o score da requisição. Só o dict externo é
+        novo (o score muda por requisição); colunas, tags e tipos são
+        referências aos campos imutáveis do registro.
+        """
+        return {
+            "id": self.id,
+            "text": self.text,
+            "score": float(score),
+            "columns": self.column_dicts,
+            "tags": self.tags,
+            "glossary_terms": self.glossary_terms,
+            "schema": self.schema,
+            "table": self.table,
+            "domain": self.domain,
+            "column_names": self.column_names,
+            "column_types": self.column_types,
+            "pk": self.pk
+        }
+
+
+class TableCatalog:
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add_get_result(self, res: dict):
+        """Decodifica um resultado de collection.get(include=[documents, metadatas])."""
+        ids = res.get("ids") or []
+        docs = res.get("documents") or []
+        metas = res.get("metadatas") or []
+
+        records = {}
+        for i, tid in enumerate(ids):
+            meta = metas[i] if i < len(metas) else None
+            if not isinstance(meta, dict):
+                continue
+            records[tid] = TableRecord(tid, docs[i] if i < len(docs) else "", meta)
+
+        with self._lock:
+            self._records.update(records)
+
+    def get(self, tid: str):
+        return self._records.get(tid)
+
+    def get_many(self, col, ids: list) -> dict:
+        """
+        {id: TableRecord}. Ids ausentes (ex.: documentos indexados depois da
+        carga) são buscados com um único collection.get e passam a fazer parte
+        do catálogo.
+        """
+        missing = [tid for tid in ids if tid not in self._records]
+        if missing:
+            self.add_get_result(col.get(ids=missing, include=["documents", "metadatas"]))
+
+        return {tid: self._records[tid] for tid in ids if tid in self._records}
+
+
+def load_catalog(col) -> TableCatalog:
+    catalog = TableCatalog()
+    catalog.add_get_result(col.get(include=["documents", "metadatas"]))
+    print(f"📚 Catálogo carregado: {len(catalog)} tabelas/documentos.")
+    return catalog
@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import math
+import heapq
+import threading
+import unicodedata
+
+from app.core.config import settings
+from app.core.schema_version import get_schema_version
+
+
+# -------------------------------------------
+# ÍNDICE LEXICAL (BM25) SOBRE NOMES DO SCHEMA
+# -------------------------------------------
+# Perguntas de ERP trazem identificadores literais ("codcli", "nfe",
+# "duplicata") que o modelo denso resolve mal. O indexer monta um índice
+# invertido sobre nome da tabela, colunas, tags e glossário; a busca BM25
+# roda em memória e é combinada com a vetorial por RRF no map_tables.
+LEXICAL_INDEX_FILE = os.path.join(settings.chroma_dir, "lexical_index.json")
+
+# peso de cada campo (repetição dos termos no documento)
+FIELD_WEIGHTS = {"table": 3, "columns": 1, "tags": 2, "glossary": 2}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9_]+")
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(c)
+    )
+
+
+def _term(word: str) -> str:
+    # plural simples do português: "clientes" -> "cliente", "notas" -> "nota"
+    if len(word) > 4 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list:
+    """
+    Tokens normalizados (minúsculas, sem acento). Identificadores com "_"
+    geram o termo inteiro e as partes: "nome_cliente" -> nome_cliente, nome, cliente.
+    """
+    tokens = []
+    for word in _WORD.findall(_strip_accents(str(text).lower())):
+        tokens.append(_term(word))
+        if "_" in word:
+            tokens.extend(_term(p) for p in word.split("_") if p)
+    return tokens
+
+
+def _document_terms(doc: dict) -> list:
+    terms = []
+    fields = {
+        "table": [doc.get("table") or ""],
+        "columns": [c.get("name", "") for c in doc.get("columns", []) if isinstance(c, dict)],
+        "tags": doc.get("tags") or [],
+        "glossary": doc.get("glossary") or [],
+    }
+    for field, values in fields.items():
+        tokens = [t for v in values if isinstance(v, str) for t in tokenize(v)]
+        terms.extend(tokens * FIELD_WEIGHTS[field])
+    return terms
+
+
+def build_lexical_index(docs, path=LEXICAL_INDEX_FILE) -> int:
+    """Monta e grava o índice invertido das tabelas. Retorna o número de termos."""
+    ids, lengths, postings = [], [], {}
+
+    for d in docs:
+        terms = _document_terms(d)
+        doc_idx = len(ids)
+        ids.append(d["id"])
+        lengths.append(len(terms))
+
+        counts = {}
+        for t in terms:
+            counts[t] = counts.get(t, 0) + 1
+        for t, tf in counts.items():
+            postings.setdefault(t, []).append([doc_idx, tf])
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "lengths": lengths, "postings": postings}, f)
+    os.replace(tmp, path)  # troca atômica para a API
+
+    return len(postings)
+
+
+class LexicalIndex:
+    def __init__(self, ids, lengths, postings):
+        self.ids = ids
+        self.lengths = lengths
+        self.avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+        n = len(ids)
+        # idf pré-calculado por termo (BM25 com +1 para não ficar negativo)
+        self.postings = {
+            term: (math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5)), plist)
+            for term, plist in postings.items()
+        }
+
+    def search(self, question: str, top_k: int = 10) -> list:
+        """[(id, score)] em ordem decrescente de score BM25."""
+        scores = {}
+
+        for term in set(tokenize(question)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+
+            idf, plist = entry
+            for doc_idx, tf in plist:
+                norm = 1 - BM25_B + BM25_B * self.lengths[doc_idx] / (self.avgdl or 1)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+        return [(self.ids[i], s) for i, s in best]
+
+
+_cache = {"index": None, "version": None}
+_lock = threading.Lock()
+
+
+def load_lexical_index(path=LEXICAL_INDEX_FILE):
+    """Índice em memória, recarregado quando a versão do schema muda; None se não existir."""
+    version = get_schema_version()
+    if _cache["version"] == version:
+        return _cache["index"]
+
+    with _lock:
+        if _cache["version"] != version:
+            index = None
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                index = LexicalIndex(data["ids"], data["lengths"], data["postings"])
+            except (OSError, KeyError, ValueError) as e:
+                if os.path.exists(path):
+                    print(f"[WARN] Índice lexical inválido: {e}")
+
+            _cache["index"] = index
+            _cache["version"] = version
+
+        return _cache["index"]
@@ -1,218 +1,530 @@
 import os
 import json
+import time
+import threading
 import joblib
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
 import numpy as np
-from app.data_pipeline.classifier import TableClassifier
+from app.data_pipeline.classifier import TableClassifier, MODEL_PATH as CLASSIFIER_PATH
+from app.data_pipeline.tag_index import load_tag_index
+from app.core.metrics import stage_timer
+from app.core.concurrency import submit_in_stage
+from app.core.models import LazyModel, EMBED_MODEL
+from app.core.schema_version import get_schema_version
+from app.agents.mapping_agent.catalog import TableRecord, load_catalog
+from app.agents.mapping_agent.vector_index import load_vector_index
+from app.agents.mapping_agent.lexical_index import load_lexical_index
 
-
-CLASSIFIER_PATH = "app/agents/mapping_agent/table_classifier.joblib"
-
-EMBED_MODEL_PATH = settings.embed_model_path
-embedder = SentenceTransformer(EMBED_MODEL_PATH)
+# modelo compartilhado (app.core.models), carregado no primeiro uso
+embedder = LazyModel(EMBED_MODEL)
 
 
 # -------------------------------------------
-# CARREGAR CLASSIFICADOR
+# CARREGAR CLASSIFICADOR (residente)
 # -------------------------------------------
+# O classificador fica em memória; a cada uso só comparamos o mtime do
+# joblib (um stat) e recarregamos se o arquivo foi retreinado.
+_classifier = {"clf": None, "mtime": None, "loaded_at": None}
+_classifier_lock = threading.Lock()
+
+
+def _classifier_mtime():
+    try:
+        return os.stat(CLASSIFIER_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def reload_classifier(force=False):
+    """
+    (Re)carrega o classificador do disco. Sem force, só recarrega se o
+    mtime mudou. Se o novo arquivo não abrir (ex.: ainda sendo gravado),
+    o modelo anterior continua em uso.
+    """
+    with _classifier_lock:
+        mtime = _classifier_mtime()
+        current = _classifier["clf"]
+
+        if not force and current is not None and mtime == _classifier["mtime"]:
+            return current
+
+        clf = TableClassifier(CLASSIFIER_PATH)
+
+        if clf.model is None and current is not None and current.model is not None:
+            print("[WARN] Novo classificador inválido; mantendo o anterior.")
+            clf = current
+        elif current is not None:
+            print("🔄 Classificador recarregado.")
+
+        _classifier.update(clf=clf, mtime=mtime, loaded_at=time.time())
+        return clf
+
 
 def load_classifier():
-    clf = TableClassifier()
+    """Classificador residente (None se não houver modelo treinado)."""
+    clf = _classifier["clf"]
+    if clf is None or _classifier_mtime() != _classifier["mtime"]:
+        clf = reload_classifier()
+
     if clf.model is None:
         return None
     return clf
 
 
+def classifier_info() -> dict:
+    clf = _classifier["clf"]
+    return {
+        "path": CLASSIFIER_PATH,
+        "loaded": clf is not None and clf.model is not None,
+        "classes": len(clf.label_encoder.classes_) if clf is not None and clf.label_encoder is not None else 0,
+        "mtime": _classifier["mtime"],
+        "loaded_at": _classifier["loaded_at"]
+    }
+
+
 # -------------------------------------------
-# CLIENTE DO CHROMA
+# CLIENTE DO CHROMA (um por processo)
 # -------------------------------------------
+# Cliente e handles de coleção ficam em memória entre requisições; a
+# consulta custa só a busca no HNSW. Os handles são recarregados quando a
+# versão do schema muda (o pipeline recria a coleção) e o cliente é
+# reaberto se uma consulta falhar.
+SCHEMA_COLLECTION = "db_schema"
+DOCS_COLLECTION = "external_docs"
+
+_chroma = {"client": None, "collections": {}, "catalogs": {}, "version": None}
+_chroma_lock = threading.Lock()
+_catalog_lock = threading.Lock()
+
+
 def chroma_client():
-    return chromadb.PersistentClient(path=settings.chroma_dir)
+    with _chroma_lock:
+        if _chroma["client"] is None:
+            _chroma["client"] = chromadb.PersistentClient(path=settings.chroma_dir)
+        return _chroma["client"]
+
+
+def get_chroma_collection(name: str = SCHEMA_COLLECTION):
+    """Handle em cache da coleção (exceção se ela não existir)."""
+    version = get_schema_version()
+
+    with _chroma_lock:
+        if _chroma["version"] != version:
+            _chroma["collections"].clear()
+            _chroma["catalogs"].clear()
+            _chroma["version"] = version
+
+        col = _chroma["collections"].get(name)
+        if col is None:
+            if _chroma["client"] is None:
+                _chroma["client"] = chromadb.PersistentClient(path=settings.chroma_dir)
+            col = _chroma["client"].get_collection(name)
+            _chroma["collections"][name] = col
+
+        return col
+
+
+def get_catalog(col, name: str = SCHEMA_COLLECTION):
+    """Catálogo decodificado da coleção (carregado uma vez por versão do schema)."""
+    catalog = _chroma["catalogs"].get(name)
+    if catalog is not None:
+        return catalog
+
+    with _catalog_lock:
+        catalog = _chroma["catalogs"].get(name)
+        if catalog is None:
+            catalog = load_catalog(col)
+            _chroma["catalogs"][name] = catalog
+        return catalog
+
+
+def reset_chroma():
+    """Descarta cliente e handles; a próxima chamada reabre o store."""
+    with _chroma_lock:
+        client = _chroma["client"]
+        _chroma["client"] = None
+        _chroma["collections"].clear()
+
+    # o chromadb reaproveita o System por caminho; limpa para reconectar de fato
+    if client is not None and hasattr(client, "clear_system_cache"):
+        try:
+            client.clear_system_cache()
+        except Exception:
+            pass
 
 
 # -------------------------------------------
 # SCORING TAGS SEMÂNTICAS
 # -------------------------------------------
+def _question_vector(question: str) -> np.ndarray:
+    q_emb = embedder.encode_cached([question])[0]
+    return q_emb / (np.linalg.norm(q_emb) + 1e-9)
+
+
 def score_semantic_tags(question: str, tags: list[str]) -> float:
     if not tags:
         return 0.0
 
-    q_emb = embedder.encode(question)
-    t_emb = embedder.encode(tags)
+    q_emb = _question_vector(question)
+    index = load_tag_index()
 
-    sims = np.dot(t_emb, q_emb) / (
-        np.linalg.norm(t_emb, axis=1) * np.linalg.norm(q_emb) + 1e-9
-    )
-    return float(max(sims))
+    # tags pré-codificadas no indexer; só as desconhecidas passam pelo modelo
+    rows = [index.terms[t] for t in tags if t in index.terms] if index else []
+    unknown = [t for t in tags if not index or t not in index.terms]
+
+    best = float(np.max(index.matrix[rows] @ q_emb)) if rows else -1.0
+
+    if unknown:
+        t_emb = embedder.encode_cached(unknown)
+        sims = np.dot(t_emb, q_emb) / (np.linalg.norm(t_emb, axis=1) + 1e-9)
+        best = max(best, float(max(sims)))
+
+    return best
+
+
+def tag_search_batch(questions: list[str], top_k: int = 10) -> list:
+    """
+    Tabelas cujas tags/termos de glossário (pré-codificados no indexer)
+    mais se parecem com cada pergunta; por pergunta, [(id, score)].
+    """
+    index = load_tag_index() if settings.tag_search_enabled else None
+    if index is None or not len(index.terms):
+        return [[] for _ in questions]
+
+    q_embs = embedder.encode_cached(questions)
+    q_embs = q_embs / (np.linalg.norm(q_embs, axis=1, keepdims=True) + 1e-9)
+
+    with stage_timer("tag_query"):
+        return index.rank_tables(q_embs, top_k=top_k)
 
 
 # -------------------------------------------
-# NORMALIZAÇÃO ROBUSTA DE METADADOS
+# VECTOR SEARCH — versão fortificada
 # -------------------------------------------
+def _query_field(res: dict, key: str, i: int) -> list:
+    rows = res.get(key) or []
+    if i < len(rows) and rows[i] is not None:
+        return rows[i]
+    return []
+
+
+def _parse_query_result(res: dict, qi: int, threshold: float, records: dict) -> list:
+    """Converte o resultado da qi-ésima pergunta de col.query em tabelas do catálogo."""
+    ids = _query_field(res, "ids", qi)
+    dists = _query_field(res, "distances", qi)
+
+    out = []
+
+    for i in range(len(ids)):
+        tid = ids[i]
+        dist = dists[i] if i < len(dists) else 0.0
+        if dist < threshold:
+                continue
+
+        record = records.get(tid)
+        if record is not None:
+            out.append(record.as_result(dist))
+
+    return out
 
-def normalize_json_field(value):
+
+def fetch_tables_by_id(ids: list[str]) -> dict:
     """
-    Aceita:
-    - lista de dicts
-    - lista de strings JSON
-    - string contendo JSON
-    - None
-    Retorna SEMPRE: lista de dicts limpos
+    Busca as tabelas pelo id direto no catálogo em memória — sem embedding
+    nem busca ANN. Retorna {id: TableRecord}.
     """
-    if value is None:
-        return []
+    if not ids:
+        return {}
+
+    try:
+        col = get_chroma_collection()
+        return get_catalog(col).get_many(col, ids)
+    except:
+        return {}
+
 
-    # caso seja string JSON
-    if isinstance(value, str):
+def _chroma_query(col, q_embs: list, top_k: int, name=SCHEMA_COLLECTION, include=("distances",)):
+    """
+    col.query (por padrão só ids/distâncias: os metadados vêm do catálogo).
+    Retorna (resultado, coleção) ou (None, None).
+    """
+    def query(col):
+        return col.query(
+            query_embeddings=q_embs,
+            n_results=top_k,
+            include=list(include)
+        )
+
+    with stage_timer("chroma_query"):
         try:
-            value = json.loads(value)
-        except:
-            return []
-
-    # caso seja lista
-    if isinstance(value, list):
-        clean = []
-        for item in value:
-            if isinstance(item, dict):
-                clean.append(item)
-            elif isinstance(item, str):
-                try:
-                    obj = json.loads(item)
-                    if isinstance(obj, dict):
-                        clean.append(obj)
-                except:
-                    pass
-        return clean
+            return query(col), col
+        except Exception as e:
+            # coleção recriada ou store corrompido: reconecta e tenta uma vez
+            print(f"[WARN] Falha na consulta ao Chroma ({e}); reconectando...")
+            reset_chroma()
+            try:
+                col = get_chroma_collection(name)
+                return query(col), col
+            except:
+                return None, None
+
+
+def vector_search_batch(questions: list[str], top_k: int = 10, threshold=0.05) -> list[list]:
+    """
+    Busca várias perguntas de uma vez: um único encode em lote e uma única
+    consulta com múltiplos vetores (col.query no Chroma ou um matmul no
+    backend NumPy). Retorna uma lista de resultados por pergunta.
+    """
+    if not questions:
+        return []
 
-    return []
+    try:
+        col = get_chroma_collection()
+    except:
+        return [[] for _ in questions]
 
+    q_embs = embedder.encode_cached(questions)
 
-def normalize_string_list(value):
-    """Campo tags e glossary — podem ser string JSON ou lista."""
-    if value is None:
-        return []
+    index = load_vector_index() if settings.vector_backend == "numpy" else None
 
-    if isinstance(value, str):
-        try:
-            return json.loads(value)
-        except:
-            return []
+    if index is not None:
+        with stage_timer("vector_query"):
+            res = index.query(q_embs, top_k=top_k)
+    else:
+        res, col = _chroma_query(col, q_embs.tolist(), top_k)
+        if res is None:
+            return [[] for _ in questions]
 
-    if isinstance(value, list):
-        return value
+    found = [tid for row in (res.get("ids") or []) for tid in (row or [])]
+    try:
+        records = get_catalog(col).get_many(col, list(dict.fromkeys(found)))
+    except Exception as e:
+        print(f"[WARN] Falha ao carregar o catálogo: {e}")
+        return [[] for _ in questions]
+
+    return [_parse_query_result(res, i, threshold, records) for i in range(len(questions))]
 
-    return []
+
+def vector_search(question: str, top_k: int = 10, threshold=0.05):
+    return vector_search_batch([question], top_k=top_k, threshold=threshold)[0]
 
 
 # -------------------------------------------
-# VECTOR SEARCH — versão fortificada
+# DOCUMENTOS EXTERNOS (coleção própria)
 # -------------------------------------------
-def vector_search(question: str, top_k: int = 10, threshold=0.05):
-    client = chroma_client()
+def docs_search_batch(questions: list[str], top_k: int = 3) -> list[list]:
+    """
+    Busca na coleção de documentos externos. Os trechos não entram no
+    catálogo (o corpus pode ter dezenas de milhares): documentos e
+    metadados vêm direto no col.query.
+    """
+    if not questions:
+        return []
 
     try:
-        col = client.get_collection("db_schema")
+        col = get_chroma_collection(DOCS_COLLECTION)
     except:
-        return []
+        return [[] for _ in questions]
 
-    q_emb = embedder.encode([question]).tolist()
+    q_embs = embedder.encode_cached(questions)
 
-    res = col.query(
-        query_embeddings=q_emb,
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"]
+    res, _ = _chroma_query(
+        col, q_embs.tolist(), top_k,
+        name=DOCS_COLLECTION,
+        include=("documents", "metadatas", "distances")
     )
-
-    ids = res.get("ids", [[]])[0]
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
-    dists = res.get("distances", [[]])[0]
+    if res is None:
+        return [[] for _ in questions]
 
     out = []
+    for qi in range(len(questions)):
+        ids = _query_field(res, "ids", qi)
+        docs = _query_field(res, "documents", qi)
+        metas = _query_field(res, "metadatas", qi)
+        dists = _query_field(res, "distances", qi)
+
+        hits = []
+        for i, tid in enumerate(ids):
+            meta = metas[i] if i < len(metas) else None
+            if isinstance(meta, dict):
+                record = TableRecord(tid, docs[i] if i < len(docs) else "", meta)
+                hits.append(record.as_result(dists[i] if i < len(dists) else 0.0))
+        out.append(hits)
 
-    for i in range(len(ids)):
-        tid = ids[i]
-        meta = metas[i] if i < len(metas) else {}
-        doc = docs[i] if i < len(docs) else ""
-        dist = dists[i] if i < len(dists) else 0.0
-        if dist < threshold:
-                continue
+    return out
 
-        if not isinstance(meta, dict):
-            continue
-
-        # NORMALIZAÇÃO 100% — remove erro de coluna inválida
-        columns = normalize_json_field(meta.get("columns"))
-        tags = normalize_string_list(meta.get("tags"))
-        glossary = normalize_string_list(meta.get("glossary_terms"))
-
-        out.append({
-            "id": tid,
-            "text": doc or "",
-            "score": float(dist),
-            "columns": columns,
-            "tags": tags,
-            "glossary_terms": glossary,
-            "schema": meta.get("schema"),
-            "table": meta.get("table"),
-            "domain": meta.get("domain", "")
-        })
 
-    return out
+def docs_search(question: str, top_k: int = 3):
+    return docs_search_batch([question], top_k=top_k)[0]
 
 
 # -------------------------------------------
 # BUSCA PELO CLASSIFICADOR
 # -------------------------------------------
-def classifier_search(question, top_k=10, threshold=0.05):
+def classifier_search_batch(questions: list[str], top_k=10, threshold=0.05) -> list:
+    """
+    Classifica todas as perguntas num único predict e enriquece as tabelas
+    previstas com um único collection.get pelos ids previstos.
+    Retorna, por pergunta, a lista de tabelas ou None.
+    """
     clf = load_classifier()
     if clf is None:
-        return None
+        return [None for _ in questions]
 
     try:
-        predictions = clf.predict(question, top_k=top_k)
+        with stage_timer("classifier"):
+            predictions = clf.predict_batch(questions, top_k=top_k)
+
+        wanted = sorted({
+            p["id"] for preds in predictions for p in preds
+            if p["score"] >= threshold
+        })
+        by_id = fetch_tables_by_id(wanted)
 
         results = []
-        for p in predictions:
-            if p["score"] < threshold:
-                continue
+        for preds in predictions:
+            tables = []
+            for p in preds:
+                if p["score"] < threshold:
+                    continue
 
-            table_id = p["id"]
-            chroma_result = vector_search(table_id, top_k=1)
+                record = by_id.get(p["id"])
+                if record is not None:
+                    tables.append(record.as_result(p["score"]))
 
-            if chroma_result:
-                enriched = chroma_result[0]
-                enriched["score"] = p["score"]
-                results.append(enriched)
+            results.append(tables or None)
 
-        return results or None
+        return results
 
     except Exception as e:
         print(f"[WARN] Erro no classificador: {e}")
-        return None
+        return [None for _ in questions]
 
-def map_tables(question: str, top_k: int = 10):
-    classified = classifier_search(question, top_k=top_k)
 
-    # fallback para vector search
-    tables = classified or vector_search(question, top_k=top_k)
+def classifier_search(question, top_k=10, threshold=0.05):
+    return classifier_search_batch([question], top_k=top_k, threshold=threshold)[0]
 
-    # garante que seja lista
-    if not tables or not isinstance(tables, list):
-        return []
 
-    # detecta documento externo
-    if tables and tables[0]["id"].startswith("doc:"):
+def _group_tables(tables, docs=None, distances=None) -> list:
+    """
+    Decide entre tabelas (SQL) e documentos externos pela menor distância
+    de cada busca: os documentos só ganham se estiverem mais próximos da
+    pergunta que a melhor tabela por settings.docs_route_margin (ou se
+    nenhuma tabela foi encontrada).
+    """
+    tables = tables if isinstance(tables, list) else []
+    docs = docs or []
+
+    best_doc = min((d["score"] for d in docs), default=None)
+    best_table = min(distances or [], default=None)
+
+    use_docs = bool(docs) and (
+        not tables
+        or (best_table is not None and best_doc + settings.docs_route_margin < best_table)
+    )
+
+    if use_docs:
         return [{
             "type": "doc",
-            "items": tables
+            "items": docs
         }]
 
-    # senão são tabelas SQL
+    if not tables:
+        return []
+
+    # tabelas SQL
     return [{
         "type": "table",
         "items": tables
-    }]
\ No newline at end of file
+    }]
+
+
+# -------------------------------------------
+# BUSCA LEXICAL + FUSÃO (RRF)
+# -------------------------------------------
+def lexical_search_batch(questions: list[str], top_k: int = 10) -> list:
+    """BM25 sobre nomes/colunas/tags; por pergunta, [(id, score)]."""
+    index = load_lexical_index() if settings.lexical_search_enabled else None
+    if index is None:
+        return [[] for _ in questions]
+
+    with stage_timer("lexical_query"):
+        return [index.search(q, top_k=top_k) for q in questions]
+
+
+def fuse_rrf(dense: list, rankings: list, records: dict, k: int = 60) -> list:
+    """
+    Reciprocal rank fusion: score = soma de 1 / (k + posição) em cada lista.
+    `dense` são tabelas já resolvidas; `rankings` são listas [(id, score)]
+    (lexical, tags...). Tabelas que só aparecem nelas vêm do catálogo (records).
+    """
+    rankings = [r for r in rankings if r]
+    if not rankings:
+        return dense or []
+
+    scores, tables = {}, {}
+
+    for rank, t in enumerate(dense or []):
+        scores[t["id"]] = scores.get(t["id"], 0.0) + 1.0 / (k + rank + 1)
+        tables[t["id"]] = t
+
+    for ranking in rankings:
+        for rank, (tid, _) in enumerate(ranking):
+            if tid not in tables:
+                record = records.get(tid)
+                if record is None:
+                    continue
+                tables[tid] = record.as_result(0.0)
+            scores[tid] = scores.get(tid, 0.0) + 1.0 / (k + rank + 1)
+
+    fused = []
+    for tid in sorted(scores, key=scores.get, reverse=True):
+        table = tables[tid]
+        table["score"] = scores[tid]
+        fused.append(table)
+    return fused
+
+
+def map_tables_batch(questions: list[str], top_k: int = 10) -> list[list]:
+    if not questions:
+        return []
+
+    # embedding único (cache LRU) para as duas coleções
+    embedder.encode_cached(questions)
+
+    # documentos externos em paralelo com a busca no schema
+    docs_future = submit_in_stage("docs", docs_search_batch, questions, settings.docs_top_k)
+
+    classified = classifier_search_batch(questions, top_k=top_k)
+
+    # busca vetorial no schema: fallback do classificador e base do roteamento
+    vector = vector_search_batch(questions, top_k=top_k)
+
+    tables = [c or v for c, v in zip(classified, vector)]
+    distances = [[t["score"] for t in v] for v in vector]
+
+    # identificadores literais ("codcli", "nfe") reforçados pela busca lexical,
+    # conceitos de negócio pelas tags/glossário de cada tabela
+    lexical = lexical_search_batch(questions, top_k=top_k)
+    tagged = tag_search_batch(questions, top_k=top_k)
+    wanted = list(dict.fromkeys(tid for hits in lexical + tagged for tid, _ in hits))
+    records = fetch_tables_by_id(wanted)
+
+    tables = [
+        fuse_rrf(t, [lex, tag], records, k=settings.rrf_k)[:top_k]
+        for t, lex, tag in zip(tables, lexical, tagged)
+    ]
+
+    try:
+        docs = docs_future.result()
+    except Exception as e:
+        print(f"[WARN] Falha na busca de documentos: {e}")
+        docs = [[] for _ in questions]
+
+    return [_group_tables(t, d, dist) for t, d, dist in zip(tables, docs, distances)]
+
+
+def map_tables(question: str, top_k: int = 10):
+    return map_tables_batch([question], top_k=top_k)[0]
@@ -0,0 +1,126 @@
+import os
+import json
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.schema_version import get_schema_version
+
+
+# -------------------------------------------
+# ÍNDICE VETORIAL EXATO (NumPy)
+# -------------------------------------------
+# Para alguns milhares de tabelas, a busca exata por cosseno numa matriz
+# contígua é mais rápida e previsível que o HNSW persistente do Chroma.
+# O indexer grava a matriz normalizada (.npy) + os ids; a API abre a
+# matriz com memmap e resolve o top-k com um matmul + argpartition.
+# Ativado com VECTOR_BACKEND=numpy.
+VECTOR_INDEX_FILE = os.path.join(settings.chroma_dir, "table_embeddings.npy")
+VECTOR_IDS_FILE = os.path.join(settings.chroma_dir, "table_ids.json")
+
+# linhas convertidas por vez quando a matriz está em float16 (~12 MB com dim 768)
+SCAN_BLOCK_ROWS = 4096
+
+
+def write_vector_index(ids: list, embeddings, dtype=None):
+    """Grava a matriz (linhas normalizadas) e os ids; troca atômica dos arquivos."""
+    dtype = np.dtype(dtype or settings.vector_index_dtype)
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9)
+
+    tmp = VECTOR_INDEX_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(matrix, dtype=dtype))
+    os.replace(tmp, VECTOR_INDEX_FILE)
+
+    tmp = VECTOR_IDS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(list(ids), f)
+    os.replace(tmp, VECTOR_IDS_FILE)
+
+
+class NumpyVectorIndex:
+    def __init__(self, ids: list, matrix: np.ndarray):
+        self.ids = ids
+        self.matrix = matrix  # memmap (n x dim)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _similarities(self, q: np.ndarray) -> np.ndarray:
+        """
+        q @ matrix.T. Em float32 lê o memmap direto; em float16 converte
+        um bloco de linhas por vez (memória temporária limitada, o matmul
+        continua no BLAS em float32 e a matriz inteira nunca é copiada).
+        """
+        if self.matrix.dtype == np.float32:
+            return q @ self.matrix.T
+
+        n = len(self.ids)
+        sims = np.empty((len(q), n), dtype=np.float32)
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            block = self.matrix[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            sims[:, start:start + len(block)] = q @ block.T
+        return sims
+
+    def query(self, q_embs, top_k: int = 10) -> dict:
+        """
+        Top-k exato para várias perguntas de uma vez. Retorna no mesmo
+        formato do col.query do Chroma (distância de cosseno = 1 - similaridade).
+        """
+        q = np.asarray(q_embs, dtype=np.float32)
+        q = q / (np.linalg.norm(q, axis=1, keepdims=True) + 1e-9)
+
+        n = len(self.ids)
+        k = min(top_k, n)
+        if k <= 0:
+            return {"ids": [[] for _ in q], "distances": [[] for _ in q]}
+
+        sims = self._similarities(q)  # (perguntas x n)
+
+        if k < n:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(n), (len(q), 1))
+
+        rows = np.arange(len(q))[:, None]
+        order = np.argsort(-sims[rows, top], axis=1)
+        top = top[rows, order]
+
+        return {
+            "ids": [[self.ids[j] for j in row] for row in top],
+            "distances": (1.0 - sims[rows, top]).tolist()
+        }
+
+
+_cache = {"index": None, "version": None}
+_lock = threading.Lock()
+
+
+def load_vector_index():
+    """Índice em memória (memmap), recarregado quando a versão do schema muda; None se não existir."""
+    version = get_schema_version()
+    if _cache["version"] == version:
+        return _cache["index"]
+
+    with _lock:
+        if _cache["version"] != version:
+            index = None
+            try:
+                with open(VECTOR_IDS_FILE, encoding="utf-8") as f:
+                    ids = json.load(f)
+                matrix = np.load(VECTOR_INDEX_FILE, mmap_mode="r")
+
+                if matrix.ndim == 2 and len(ids) == matrix.shape[0]:
+                    index = NumpyVectorIndex(ids, matrix)
+                else:
+                    print("[WARN] Índice vetorial inconsistente (ids x matriz); usando o Chroma.")
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Índice vetorial NumPy indisponível ({e}); usando o Chroma.")
+
+            _cache["index"] = index
+            _cache["version"] = version
+
+        return _cache["index"]
@@ -1,2 +1,88 @@
+import re
+import unicodedata
+
+
 def normalize_question(text):
- return text.lower().strip()
+ # minúsculas e espaços colapsados: chave estável para deduplicar perguntas
+ return " ".join(text.lower().split())
+
+
+# -------------------------------------------
+# NEGAÇÕES
+# -------------------------------------------
+# Embeddings quase não separam "clientes ativos" de "clientes inativos"
+# (cosseno > 0.95 no e5). A assinatura abaixo entra junto com o
+# embedding nos caches: perguntas com negações diferentes nunca casam.
+NEGATION_WORDS = {
+ "nao", "sem", "nunca", "nenhum", "nenhuma", "jamais",
+ "exceto", "excluindo", "fora", "menos", "nem"
+}
+NEGATION_PREFIXES = ("des", "in", "im", "ir")
+
+_WORD = re.compile(r"\w+")
+
+
+def _strip_accents(text):
+ return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def _singular(word):
+ return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+
+def negation_signature(text):
+ """
+ (palavras de negação, palavras normalizadas) da pergunta; compare duas
+ assinaturas com same_negation().
+ """
+ raw = _WORD.findall(_strip_accents(text.lower()))
+ # negações antes do singular ("menos", "jamais" terminam em "s")
+ negations = {w for w in raw if w in NEGATION_WORDS}
+ words = {_singular(w) for w in raw}
+ return frozenset(negations), frozenset(words)
+
+
+def _negated_roots(words):
+ roots = set()
+ for w in words:
+  for prefix in NEGATION_PREFIXES:
+   if w.startswith(prefix) and len(w) - len(prefix) >= 4:
+    roots.add(w[len(prefix):])
+ return roots
+
+
+def same_negation(sig_a, sig_b):
+ """
+ True se as duas perguntas têm a mesma polaridade: mesmas palavras de
+ negação e nenhuma palavra negada por prefixo numa que apareça sem o
+ prefixo na outra ("ativos" x "inativos").
+ """
+ neg_a, words_a = sig_a
+ neg_b, words_b = sig_b
+ if neg_a != neg_b:
+  return False
+ if _negated_roots(words_a) & (words_b - words_a):
+  return False
+ if _negated_roots(words_b) & (words_a - words_b):
+  return False
+ return True
+
+
+# -------------------------------------------
+# LITERAIS
+# -------------------------------------------
+# "pedidos do cliente 123" / "pedidos do cliente 456" e "vendas de 2023" /
+# "vendas de 2024" também passam de 0.95: números e textos entre aspas
+# precisam ser iguais para reaproveitar o SQL de outra pergunta.
+_LITERAL = re.compile(r"'([^']*)'|\"([^\"]*)\"|(\d+(?:[.,/-]\d+)*)")
+
+
+def literal_signature(text):
+ """Conjunto de números e trechos entre aspas da pergunta (sem distinção de caixa)."""
+ out = set()
+ for single, double, number in _LITERAL.findall(text or ""):
+  if number:
+   out.add(number)
+  else:
+   out.add(" ".join((single or double).lower().split()))
+ return frozenset(out)
@@ -1,7 +1,8 @@
 # app/agents/postprocessing_agent/answer_agent.py
 import json
 import asyncio
-from app.agents.llm.llama_api import call_llama_generate
+from app.agents.llm.llama_api import acall_llama_generate, astream_llama_generate
+from app.core.metrics import stage_timer
 
 
 # ---------------------------
@@ -30,38 +31,40 @@ def build_table_summary(columns, rows, max_rows=20, max_chars=6000):
 
     return text
 
-async def call_llama_generate_safe(prompt: str, timeout: int = 300):
+TIMEOUT_ANSWER = (
+    "A análise detalhada demorou mais do que o esperado. "
+    "Aqui está um resumo rápido baseado apenas nos dados fornecidos."
+)
+ERROR_ANSWER = "Não foi possível gerar uma explicação detalhada no momento."
+
+# Respostas de contingência (não devem ir para caches)
+FALLBACK_ANSWERS = (TIMEOUT_ANSWER, ERROR_ANSWER)
+
+
+async def call_llama_generate_safe(prompt: dict, timeout: int = 300):
     """
     Garante que a chamada da LLM nunca ultrapasse X segundos.
     Se ultrapassar, devolve um fallback rápido.
     """
 
-    loop = asyncio.get_event_loop()
-
     try:
         return await asyncio.wait_for(
-            loop.run_in_executor(None, call_llama_generate, prompt),
+            acall_llama_generate(prompt["prompt"], purpose="answer", system=prompt["system"]),
             timeout=timeout
         )
     except asyncio.TimeoutError:
-        return "A análise detalhada demorou mais do que o esperado. "\
-               "Aqui está um resumo rápido baseado apenas nos dados fornecidos."
+        return TIMEOUT_ANSWER
     except Exception:
-        return "Não foi possível gerar uma explicação detalhada no momento."
+        return ERROR_ANSWER
 
 
 # ---------------------------
 # Gerador de Resposta Natural
 # ---------------------------
-async def generate_llm_answer(question: str, columns: list, rows: list):
-    """
-    Usa a LLM para gerar explicação da resposta SQL.
-    """
-
-    table_json = build_table_summary(columns, rows)
-
-    prompt = f"""
-Você é um analista de dados que interpreta resultados de SQL.
+# Os prompts são {"system": prefixo fixo, "prompt": parte variável}.
+# O prefixo idêntico entre chamadas permite ao Ollama reaproveitar o
+# KV-cache e processar só a pergunta e os dados.
+ANSWER_SYSTEM_PROMPT = """Você é um analista de dados que interpreta resultados de SQL.
 
 Regras importantes:
 - Explique o resultado relacionando com a pergunta.
@@ -69,27 +72,36 @@ Regras importantes:
 - NÃO invente dados.
 - Baseie-se APENAS no JSON fornecido.
 - Destaque valores relevantes.
+- Escreva a melhor explicação possível em português claro."""
 
-Pergunta do usuário:
+DOCS_SYSTEM_PROMPT = """Responda a pergunta usando SOMENTE o contexto fornecido.
+Se não encontrar resposta, diga que não encontrou."""
+
+
+def build_answer_prompt(question: str, columns: list, rows: list, partial: bool = False) -> dict:
+    table_json = build_table_summary(columns, rows)
+    # resultado cortado (paginação/teto): a explicação não pode tratá-lo como total
+    note = "\nATENÇÃO: resultado parcial, a consulta tem mais linhas além destas.\n" if partial else ""
+
+    return {
+        "system": ANSWER_SYSTEM_PROMPT,
+        "prompt": f"""Pergunta do usuário:
 \"\"\"{question}\"\"\"
 
 Resultado (máx 20 linhas):
 {table_json}
+{note}
+Explicação:
+"""
+    }
 
-Escreva a melhor explicação possível em português claro:
-    """
-
-    return await call_llama_generate_safe(prompt)
-
-async def generate_llm_answer_from_docs(question: str, docs: list):
 
+def build_docs_prompt(question: str, docs: list) -> dict:
     context = "\n\n".join(d["text"] for d in docs[:3])
 
-    prompt = f"""
-Responda a pergunta usando SOMENTE o contexto abaixo.
-Se não encontrar resposta, diga que não encontrou.
-
-Pergunta:
+    return {
+        "system": DOCS_SYSTEM_PROMPT,
+        "prompt": f"""Pergunta:
 {question}
 
 Contexto:
@@ -97,25 +109,37 @@ Contexto:
 
 Resposta:
 """
+    }
 
-    return await call_llama_generate_safe(prompt)
-
-
-async def generate_llm_answer_from_docs(question: str, docs: list):
-
-    context = "\n\n".join(d["text"] for d in docs[:3])
 
-    prompt = f"""
-Responda a pergunta usando SOMENTE o contexto abaixo.
-Se não encontrar resposta, diga que não encontrou.
+async def generate_llm_answer(question: str, columns: list, rows: list, partial: bool = False):
+    """
+    Usa a LLM para gerar explicação da resposta SQL.
+    partial=True avisa que o resultado não está completo.
+    """
+    with stage_timer("answer_generation"):
+        return await call_llama_generate_safe(build_answer_prompt(question, columns, rows, partial))
 
-Pergunta:
-{question}
 
-Contexto:
-{context}
+async def generate_llm_answer_from_docs(question: str, docs: list):
+    with stage_timer("answer_generation"):
+        return await call_llama_generate_safe(build_docs_prompt(question, docs))
 
-Resposta:
-"""
 
-    return await call_llama_generate_safe(prompt)
\ No newline at end of file
+# ---------------------------
+# Resposta em streaming (tokens)
+# ---------------------------
+async def stream_llm_answer(prompt: dict, status: dict = None):
+    """
+    Emite os tokens da resposta conforme o Ollama gera.
+    Em caso de falha, emite o mesmo fallback da versão não-streaming e
+    marca status["failed"] = True (a resposta parcial não deve ir para caches).
+    """
+    with stage_timer("answer_generation"):
+        try:
+            async for token in astream_llama_generate(prompt["prompt"], purpose="answer", system=prompt["system"]):
+                yield token
+        except Exception:
+            if status is not None:
+                status["failed"] = True
+            yield ERROR_ANSWER
@@ -1,45 +1,12 @@
-import requests
-import time
-import re
-from app.core.config import settings
+# Mantido por compatibilidade: o cliente do Ollama é único
+# (app/agents/llm/ollama_client.py, com retry/backoff e pool de conexões).
+from app.agents.llm.llama_api import call_llama_generate as _call_llama_generate
+from app.agents.llm.llama_api import MODEL_NAME, LLAMA_URL
 
-LLAMA_URL = f"{settings.llama_server}/api/generate"
-MODEL_NAME = "llama3.1"
 
-def call_llama_generate(prompt: str, retries=3):
+def call_llama_generate(prompt: str, retries=None):
     """
-    Chama o LLM com retry automático e timeout expandido.
+    Chama o LLM (as novas tentativas são feitas pelo cliente compartilhado,
+    conforme settings.llm_retries; `retries` é ignorado).
     """
-
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "stream": False
-    }
-
-    for attempt in range(1, retries + 1):
-        try:
-            response = requests.post(
-                LLAMA_URL,
-                json=payload,
-                timeout=180
-            )
-            data = response.json()
-            raw = data.get("response", "").strip()
-
-            raw = re.sub(r"```.*?```", "", raw, flags=re.DOTALL)
-            raw = raw.replace("`", "")
-
-            return raw
-
-        except requests.exceptions.Timeout:
-            print(f"[WARN] Timeout na tentativa {attempt}/{retries}...")
-            if attempt == retries:
-                raise Exception("Erro ao conectar ao servidor LLM: tempo limite atingido")
-            time.sleep(2)
-
-        except Exception as e:
-            print(f"[WARN] Erro ao conectar ao LLM: {e}")
-            if attempt == retries:
-                raise Exception(f"Erro ao conectar ao servidor LLM: {e}")
-            time.sleep(2)
\ No newline at end of file
+    return _call_llama_generate(prompt)
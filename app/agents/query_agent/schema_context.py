@@ -0,0 +1,215 @@
+# app/agents/query_agent/schema_context.py
+from typing import List, Dict, Any, Mapping
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.metrics import SQL_CONTEXT_TOKENS, SQL_CONTEXT_TOKENS_SAVED
+from app.agents.mapping_agent.retriever import embedder
+from app.agents.mapping_agent.lexical_index import tokenize
+from app.data_pipeline.column_index import load_column_index
+
+
+# =====================================================
+# CONTEXTO DE SCHEMA COM ORÇAMENTO DE TOKENS
+# =====================================================
+# Tabelas de ERP com 100+ colunas deixam o prompt do SQL enorme e a
+# latência do LLM cresce com a largura da tabela. Aqui cada coluna recebe
+# uma nota de relevância para a pergunta (lexical + embedding do nome,
+# pré-calculado pelo indexer em column_embeddings.npz) e o contexto é
+# preenchido, da mais relevante para a menos, até o orçamento:
+#   - chaves (PK, *_id, colunas de junção entre as tabelas) entram sempre;
+#   - cada tabela garante settings.sql_context_min_columns colunas;
+#   - serialização compacta: uma linha por tabela, "tabela [pk]: col, col, ..."
+# As colunas omitidas continuam válidas na pós-validação do SQL
+# (remove_invalid_columns usa column_types completo).
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token), sem tokenizador do modelo."""
+    return (len(text) + 3) // 4
+
+
+def _column_names(item: Dict[str, Any]) -> list:
+    names = item.get("column_names")
+    if names is not None:
+        return list(names)
+    return [c.get("name") if isinstance(c, Mapping) else c for c in item.get("columns", [])]
+
+
+def _is_key_like(name: str) -> bool:
+    lname = name.lower()
+    return lname == "id" or lname.startswith("id_") or lname.endswith("_id")
+
+
+def _key_columns(tables_context: List[Dict[str, Any]], names_by_table: list) -> list:
+    """
+    Conjunto de chaves por tabela: PK do catálogo, colunas com cara de id e
+    identificadores repetidos em mais de uma tabela (prováveis junções).
+    """
+    seen = {}
+    for names in names_by_table:
+        for n in set(n.lower() for n in names):
+            seen[n] = seen.get(n, 0) + 1
+
+    keys = []
+    for item, names in zip(tables_context, names_by_table):
+        pk = {p.lower() for p in item.get("pk") or []}
+        keys.append({
+            n for n in names
+            if n.lower() in pk
+            or _is_key_like(n)
+            or (seen[n.lower()] > 1 and (n.lower().startswith("cod") or _is_key_like(n)))
+        })
+    return keys
+
+
+# ---------------------------
+# Relevância das colunas
+# ---------------------------
+def _lexical_scores(question_tokens: set, names: list) -> np.ndarray:
+    """1.0 para termo igual ao da pergunta; 0.5 para prefixo (ex.: "dt" / "dtemissao")."""
+    scores = np.zeros(len(names), dtype=np.float32)
+    for i, name in enumerate(names):
+        best = 0.0
+        for t in tokenize(name):
+            if t in question_tokens:
+                best = 1.0
+                break
+            if len(t) >= 3 and any(q.startswith(t) or t.startswith(q) for q in question_tokens if len(q) >= 3):
+                best = 0.5
+        scores[i] = best
+    return scores
+
+
+def _normalize(embs: np.ndarray) -> np.ndarray:
+    return embs / (np.linalg.norm(embs, axis=-1, keepdims=True) + 1e-10)
+
+
+def _embedding_scores(question: str, names_by_table: list) -> list:
+    """
+    Similaridade pergunta x nome da coluna, reescalada para [0, 1] dentro de
+    cada tabela. Os vetores das colunas vêm do índice gravado pelo indexer;
+    a pergunta já está no LRU (codificada no retrieval). Sem índice: None.
+    Colunas fora do índice (schema mudou sem reindexar) ficam com 0.
+    """
+    index = load_column_index()
+    if index is None or not index.rows:
+        return None
+
+    q = _normalize(np.asarray(embedder.encode_cached([question]))[0])
+
+    out = []
+    for names in names_by_table:
+        s = index.similarities(names, q)
+        known = ~np.isnan(s)
+        scaled = np.zeros(len(s), dtype=np.float32)
+        if known.any():
+            lo, hi = s[known].min(), s[known].max()
+            if hi > lo:
+                scaled[known] = (s[known] - lo) / (hi - lo)
+        out.append(scaled)
+    return out
+
+
+def _rank_columns(question: str, names_by_table: list) -> list:
+    question_tokens = set(tokenize(question))
+    weight = settings.sql_context_embed_weight
+
+    embed_scores = None
+    if weight > 0:
+        try:
+            embed_scores = _embedding_scores(question, names_by_table)
+        except Exception as e:
+            logger.warning("Ranking de colunas sem embeddings: %s", e)
+
+    ranked = []
+    for ti, names in enumerate(names_by_table):
+        score = _lexical_scores(question_tokens, names) * (1 - weight if embed_scores else 1.0)
+        if embed_scores:
+            score = score + embed_scores[ti] * weight
+        ranked.append(score)
+    return ranked
+
+
+# ---------------------------
+# Serialização compacta
+# ---------------------------
+def _table_line(item: Dict[str, Any], columns: list, omitted: int) -> str:
+    pk = [p for p in item.get("pk") or [] if p]
+    head = item.get("id", "?") + (f" [pk {','.join(pk)}]" if pk else "")
+    tail = f" (+{omitted} omitidas)" if omitted else ""
+    return f"{head}: {', '.join(columns)}{tail}"
+
+
+def format_full_context(tables_context: List[Dict[str, Any]]) -> str:
+    """Mesma serialização, com todas as colunas (referência de tokens economizados)."""
+    return "\n".join(_table_line(item, _column_names(item), 0) for item in tables_context)
+
+
+def build_schema_context(question: str, tables_context: List[Dict[str, Any]], budget: int = None) -> str:
+    """
+    Contexto das tabelas para o prompt do SQL dentro de `budget` tokens
+    (padrão settings.sql_context_token_budget; 0 = todas as colunas).
+    """
+    if not tables_context:
+        return "Nenhuma tabela mapeada."
+
+    budget = settings.sql_context_token_budget if budget is None else budget
+    full = format_full_context(tables_context)
+    full_tokens = estimate_tokens(full)
+
+    if budget <= 0 or full_tokens <= budget:
+        SQL_CONTEXT_TOKENS.observe(full_tokens)
+        return full
+
+    names_by_table = [_column_names(item) for item in tables_context]
+    keys = _key_columns(tables_context, names_by_table)
+    scores = _rank_columns(question, names_by_table)
+
+    # chaves + mínimo por tabela, depois candidatos globais por nota
+    # (empate favorece a tabela mais bem ranqueada no mapeamento)
+    chosen = [set(k) for k in keys]
+    candidates = []
+    for ti, names in enumerate(names_by_table):
+        order = sorted(range(len(names)), key=lambda i: -scores[ti][i])
+        picked = 0
+        for i in order:
+            if names[i] in chosen[ti]:
+                continue
+            if picked < settings.sql_context_min_columns:
+                chosen[ti].add(names[i])
+                picked += 1
+            else:
+                candidates.append((-float(scores[ti][i]), ti, i))
+    candidates.sort()
+
+    # custo de cada coluna ≈ nome + ", "
+    used = estimate_tokens("\n".join(
+        _table_line(item, [n for n in names if n in chosen[ti]], 1)
+        for ti, (item, names) in enumerate(zip(tables_context, names_by_table))
+    ))
+    for _, ti, i in candidates:
+        name = names_by_table[ti][i]
+        cost = estimate_tokens(name + ", ")
+        if used + cost > budget:
+            continue
+        chosen[ti].add(name)
+        used += cost
+
+    # colunas na ordem original da tabela (mais legível para o LLM)
+    lines = []
+    for ti, (item, names) in enumerate(zip(tables_context, names_by_table)):
+        cols = [n for n in names if n in chosen[ti]]
+        lines.append(_table_line(item, cols, len(names) - len(cols)))
+    context = "\n".join(lines)
+
+    tokens = estimate_tokens(context)
+    SQL_CONTEXT_TOKENS.observe(tokens)
+    SQL_CONTEXT_TOKENS_SAVED.inc(max(0, full_tokens - tokens))
+    logger.info(
+        "Contexto de schema no prompt: ~%d tokens (completo ~%d, economia ~%d)",
+        tokens, full_tokens, full_tokens - tokens
+    )
+
+    return context
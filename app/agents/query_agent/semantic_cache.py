@@ -0,0 +1,181 @@
+# app/agents/query_agent/semantic_cache.py
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.schema_version import get_schema_version
+from app.agents.nlp_agent.nlp_utils import negation_signature, same_negation, literal_signature
+from app.agents.mapping_agent.retriever import embedder
+
+
+# =====================================================
+# SEMANTIC CACHE
+# =====================================================
+# Guarda o resultado de /query (SQL + resposta) indexado pelo embedding da
+# pergunta. Perguntas com similaridade >= threshold ("listar clientes
+# ativos" / "lista de clientes ativos") reaproveitam o resultado e não
+# pagam geração de SQL nem explicação pela LLM.
+#
+# A similaridade sozinha não separa negações ("clientes ativos" /
+# "clientes inativos"); cada entrada guarda a assinatura de negação da
+# pergunta e só casa com perguntas de mesma polaridade. Do mesmo jeito,
+# números e textos entre aspas ("cliente 123", "vendas de 2024") precisam
+# ser idênticos.
+#
+# Invalidação:
+#   - TTL por entrada;
+#   - LRU quando passa de max_entries;
+#   - tudo é descartado quando a versão do schema muda (reindexação);
+#   - cada entrada guarda as versões das tabelas lidas pelo SQL
+#     (SQLResultCache.snapshot); a API compara no hit e re-executa o SQL
+#     se alguma tabela foi invalidada.
+class SemanticCache:
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1000, max_rows=1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()  # id -> entrada (ordem = LRU)
+        self._next_id = 0
+        self._ids = []
+        self._matrix = None            # embeddings empilhados (lazy)
+        self._version = get_schema_version()
+        self._lock = threading.Lock()
+
+    # ---------------------------
+    # Embeddings (normalizados)
+    # ---------------------------
+    def embed(self, question: str) -> np.ndarray:
+        return self.embed_batch([question])[0]
+
+    def embed_batch(self, questions: list) -> list:
+        embs = embedder.encode_cached(questions)
+        embs = embs / (np.linalg.norm(embs, axis=1, keepdims=True) + 1e-10)
+        return list(embs)
+
+    # ---------------------------
+    # Manutenção (sempre sob lock)
+    # ---------------------------
+    def _check_version(self):
+        version = get_schema_version()
+        if version != self._version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _purge_expired(self, now: float):
+        expired = [k for k, e in self._entries.items() if now - e["created"] > self.ttl]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    # ---------------------------
+    # API pública
+    # ---------------------------
+    def lookup(self, emb: np.ndarray, question: str = None):
+        """
+        Retorna {"question", "similarity", "result"} da pergunta em cache
+        mais parecida (com a mesma negação e os mesmos literais de
+        `question`), ou None se
+        nenhuma passar do threshold.
+        """
+        now = time.time()
+        signature = negation_signature(question) if question is not None else None
+        literals = literal_signature(question) if question is not None else None
+
+        with self._lock:
+            self._check_version()
+            self._purge_expired(now)
+
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._ids = list(self._entries)
+                self._matrix = np.stack([self._entries[k]["embedding"] for k in self._ids])
+
+            sims = self._matrix @ emb
+
+            for best in np.argsort(-sims):
+                similarity = float(sims[best])
+                if similarity < self.threshold:
+                    break
+
+                key = self._ids[best]
+                entry = self._entries[key]
+                if signature is not None and not same_negation(signature, entry["negation"]):
+                    continue
+                if literals is not None and literals != entry["literals"]:
+                    continue
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+                return {
+                    "question": entry["question"],
+                    "similarity": similarity,
+                    "result": dict(entry["result"]),
+                    "tables": entry["tables"]
+                }
+
+            self.misses += 1
+            return None
+
+    def store(self, question: str, emb: np.ndarray, result: dict, tables: dict = None):
+        result = dict(result)
+
+        # Resultados grandes: guarda só o SQL (re-executado no hit)
+        rows = result.get("rows")
+        if rows and len(rows) > self.max_rows:
+            result.pop("rows", None)
+            result.pop("columns", None)
+
+        with self._lock:
+            self._check_version()
+
+            self._entries[self._next_id] = {
+                "question": question,
+                "embedding": emb,
+                "negation": negation_signature(question),
+                "literals": literal_signature(question),
+                "result": result,
+                "tables": tables,
+                "created": time.time()
+            }
+            self._next_id += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "schema_version": self._version
+            }
+
+
+semantic_cache = SemanticCache(
+    threshold=settings.semantic_cache_threshold,
+    ttl=settings.semantic_cache_ttl,
+    max_entries=settings.semantic_cache_max_entries,
+    max_rows=settings.semantic_cache_max_rows
+)
@@ -1,34 +1,40 @@
 # app/agents/query_agent/sql_generator_final.py
 import re
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Union, Mapping
 
-from app.agents.mapping_agent.retriever import map_tables
-from app.agents.llm.llama_api import call_llama_generate
+from app.agents.mapping_agent.retriever import map_tables, map_tables_batch
+from app.agents.query_agent.schema_context import build_schema_context
+from app.agents.llm.llama_api import call_llama_generate_until, acall_llama_generate_until
+from app.core.metrics import stage_timer
 
 
 # =====================================================
-# 1. FORMAT CONTEXT → usado no prompt do LLM
+# 0. TIPOS DAS COLUNAS (pré-calculados no catálogo)
 # =====================================================
-def format_context(tables_context: List[Dict[str, Any]]) -> str:
-    if not tables_context:
-        return "Nenhuma tabela mapeada."
-
-    lines = []
-    for item in tables_context:
-        table_id = item.get("id", "?")
-        score = round(item.get("score", 0), 4)
-        cols = item.get("columns", [])
-        col_names = []
+def _column_types(item: Dict[str, Any]) -> Dict[str, str]:
+    """
+    {coluna minúscula: tipo minúsculo}; vem pronto do catálogo do retriever.
+    Coluna dict sem tipo fica com "" (fix_type_mismatches a ignora).
+    """
+    types = item.get("column_types")
+    if types is not None:
+        return types
 
-        for c in cols:
-            if isinstance(c, dict):
-                col_names.append(c.get("name"))
-            elif isinstance(c, str):
-                col_names.append(c)
+    out = {}
+    for c in item.get("columns", []):
+        if isinstance(c, Mapping):
+            out[(c.get("name") or "").lower()] = (c.get("type") or "").lower()
+        elif isinstance(c, str):
+            out[c.lower()] = "text"
+    return out
 
-        lines.append(f"Tabela {table_id} (relevância {score})\n  Colunas: {', '.join(col_names)}")
 
-    return "\n\n".join(lines)
+# =====================================================
+# 1. FORMAT CONTEXT → usado no prompt do LLM
+# =====================================================
+def format_context(tables_context: List[Dict[str, Any]], question: str = "") -> str:
+    """Tabelas do prompt: colunas ranqueadas pela pergunta, dentro do orçamento de tokens."""
+    return build_schema_context(question, tables_context)
 
 
 # =====================================================
@@ -49,6 +55,21 @@ def clean_llm_output(raw: str) -> str:
     return cleaned.strip()
 
 
+_COMPLETE_SQL = re.compile(r"\b(SELECT|WITH)\b[\s\S]*?;", flags=re.IGNORECASE)
+
+
+def sql_is_complete(partial: str) -> bool:
+    """
+    True quando o texto gerado até agora já contém um SELECT/WITH terminado
+    em ";" fora de bloco ``` — tudo o que vier depois seria descartado por
+    clean_llm_output, então a geração pode parar.
+    """
+    text = re.sub(r"```.*?```", "", partial, flags=re.DOTALL)
+    if "```" in text:
+        text = text[:text.index("```")]  # bloco ainda aberto: será removido
+    return _COMPLETE_SQL.search(text.replace("`", "")) is not None
+
+
 # =====================================================
 # 3. INJEÇÃO SEGURA DO SCHEMA (se faltar)
 # =====================================================
@@ -106,16 +127,7 @@ def fix_type_mismatches(sql: str, tables_context: list[dict]) -> str:
 
     for t in tables_context:
         tid = t.get("id", "").lower()
-        cols = t.get("columns", [])
-        cmap = {}
-
-        for c in cols:
-            if isinstance(c, dict):
-                name = c.get("name", "").lower()
-                typ = (c.get("type") or "").lower()
-                cmap[name] = typ
-            elif isinstance(c, str):
-                cmap[c.lower()] = "text"
+        cmap = _column_types(t)
 
         if cmap:
             table_types[tid] = cmap
@@ -225,21 +237,13 @@ def remove_invalid_columns(sql: str, tables_context: list[dict]) -> str:
     # ------------------------------
     # Coletar colunas por tabela
     # ------------------------------
-    table_cols = {}   # { schema.table : set(colunas) }
+    table_cols = {}   # { schema.table : colunas }
 
     for t in tables_context:
         tid = t.get("id", "").lower()
-        cols = t.get("columns", [])
-        valid = set()
-
-        for c in cols:
-            if isinstance(c, dict):
-                valid.add(c.get("name", "").lower())
-            elif isinstance(c, str):
-                valid.add(c.lower())
 
         if tid:
-            table_cols[tid] = valid
+            table_cols[tid] = _column_types(t).keys()
 
     # ------------------------------
     # Identificar aliases no SQL
@@ -365,14 +369,7 @@ def validate_columns(sql: str, tables_context: Union[Dict[str, Any], List[Dict[s
         if tid:
             full_tables.add(tid)
 
-        cols = t.get("columns", []) or []
-        for c in cols:
-            if isinstance(c, dict):
-                name = (c.get("name") or "").lower()
-                if name:
-                    valid_cols.add(name)
-            elif isinstance(c, str):
-                valid_cols.add(c.lower())
+        valid_cols.update(n for n in _column_types(t) if n)
 
     # 2) detectar aliases no SQL (FROM / JOIN), suportando "AS"
     alias_map = {}  # alias -> full_table_or_table_string
@@ -453,56 +450,123 @@ def validate_columns(sql: str, tables_context: Union[Dict[str, Any], List[Dict[s
 # =====================================================
 # 8. GERAÇÃO FINAL DO SQL
 # =====================================================
-def generate_sql(question: str) -> str:
-    # ----------------------
-    # tabela mais provável
-    # ----------------------
-    tables_context = map_tables(question)
-    tables_context = tables_context[:3]
+def build_tables_context(question: str):
+    """
+    Etapa de recuperação (embedding + Chroma + classificador).
+    Retorna o grupo mapeado: {"type": "table" | "doc", "items": [...]}.
+    """
+    group = _top_group(map_tables(question))
 
-    if not tables_context:
+    if group is None:
         raise Exception("Nenhuma tabela ou documento encontrado")
 
-    ctx = tables_context[0]
+    return group
+
+
+def build_tables_context_batch(questions: List[str]) -> list:
+    """
+    Versão em lote de build_tables_context (encode e busca compartilhados).
+    Retorna um grupo por pergunta, ou None quando nada foi encontrado.
+    """
+    return [_top_group(mapped) for mapped in map_tables_batch(questions)]
+
+
+def _top_group(mapped: list):
+    if not mapped:
+        return None
+
+    group = mapped[0]
+    group["items"] = group["items"][:3]  # tabela mais provável + 2 vizinhas
+    return group
 
-    if ctx["type"] == "doc":
+
+def generate_sql_from_context(question: str, mapped: dict) -> str:
+    """
+    Etapa de LLM: monta o prompt, chama o modelo e aplica as correções.
+    Retorna None quando o contexto mapeado é de documentos externos.
+    """
+    if mapped["type"] == "doc":
         return None  # <<< muito importante
 
+    tables_context = mapped["items"]
 
-    prompt = f"""
-Você é um gerador de SQL seguro.
-NÃO invente tabelas ou colunas.
+    with stage_timer("prompt_build"):
+        prompt = build_sql_prompt(question, tables_context)
 
-Use APENAS as tabelas listadas como id
-e APENAS as colubas listadas como name
+    with stage_timer("llm_sql"):
+        raw = call_llama_generate_until(
+            prompt, sql_is_complete, purpose="sql", system=SQL_SYSTEM_PROMPT
+        )
 
-{format_context(tables_context)}
+    return postprocess_sql(prompt, raw, tables_context)
 
-Retorne SOMENTE um SQL válido (terminado em ";").
-Sem explicações.
 
-Pergunta:
-{question}
-"""
+async def agenerate_sql_from_context(question: str, mapped: dict) -> str:
+    """
+    Versão assíncrona (usada pela API): a chamada ao LLM não ocupa uma
+    thread enquanto espera o Ollama.
+    """
+    if mapped["type"] == "doc":
+        return None
+
+    tables_context = mapped["items"]
+
+    with stage_timer("prompt_build"):
+        prompt = build_sql_prompt(question, tables_context)
+
+    with stage_timer("llm_sql"):
+        # streaming com parada antecipada no primeiro SQL completo
+        raw = await acall_llama_generate_until(
+            prompt, sql_is_complete, purpose="sql", system=SQL_SYSTEM_PROMPT
+        )
+
+    return postprocess_sql(prompt, raw, tables_context)
 
-    raw = call_llama_generate(prompt)
-    sql = clean_llm_output(raw)
 
+def postprocess_sql(prompt: str, raw: str, tables_context: List[Dict[str, Any]]) -> str:
     print(prompt)
     print(raw)
 
     # ----------------------
     # pipeline de correções
     # ----------------------
-    sql = inject_schema(sql, tables_context)
-    sql = remove_invalid_columns(sql, tables_context)
-    sql = fix_type_mismatches(sql, tables_context)
+    with stage_timer("sql_postprocess"):
+        sql = clean_llm_output(raw)
+        sql = inject_schema(sql, tables_context)
+        sql = remove_invalid_columns(sql, tables_context)
+        sql = fix_type_mismatches(sql, tables_context)
 
-    # validação final
-    #  validate_columns(sql, tables_context)
+        # validação final
+        #  validate_columns(sql, tables_context)
 
-    sql = re.sub(r"\s+", " ", sql).strip()
-    if not sql.endswith(";"):
-        sql += ";"
+        sql = re.sub(r"\s+", " ", sql).strip()
+        if not sql.endswith(";"):
+            sql += ";"
 
-    return sql
\ No newline at end of file
+    return sql
+
+
+# Prefixo fixo (system do Ollama): idêntico em toda chamada, então o
+# KV-cache dele é reaproveitado e só a parte variável é processada.
+SQL_SYSTEM_PROMPT = """Você é um gerador de SQL seguro.
+NÃO invente tabelas ou colunas.
+
+Cada linha do contexto é "tabela [pk chave]: colunas".
+Use APENAS essas tabelas e APENAS as colunas listadas.
+
+Inclua ORDER BY (de preferência pela chave primária).
+Retorne SOMENTE um SQL válido (terminado em ";").
+Sem explicações."""
+
+
+def build_sql_prompt(question: str, tables_context: List[Dict[str, Any]]) -> str:
+    """Parte variável do prompt (tabelas + pergunta); as regras vão em SQL_SYSTEM_PROMPT."""
+    return f"""{format_context(tables_context, question)}
+
+Pergunta:
+{question}
+"""
+
+
+def generate_sql(question: str) -> str:
+    return generate_sql_from_context(question, build_tables_context(question))
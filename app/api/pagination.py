@@ -0,0 +1,55 @@
+import hmac
+import json
+import time
+import base64
+import hashlib
+
+from app.core.config import settings
+
+
+# -------------------------------------------
+# TOKENS DE CONTINUAÇÃO
+# -------------------------------------------
+# O token carrega o SQL já validado, o offset da próxima página e o teto
+# de linhas (SQL_AUTO_LIMIT) vigente na primeira página, assinado com HMAC:
+# o cliente não consegue alterar o SQL, e a API não precisa manter cursor
+# nem linhas em memória entre as páginas.
+#
+# Cada página re-executa o SQL e avança `offset` linhas; por isso só há
+# token para SQL com ORDER BY externo (ver has_order_by). Empates no
+# ORDER BY ainda podem trocar linhas de página.
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(body: str) -> str:
+    key = settings.page_token_secret.encode()
+    return _b64(hmac.new(key, body.encode(), hashlib.sha256).digest())
+
+
+def encode_page_token(sql: str, offset: int, cap: int) -> str:
+    payload = {"sql": sql, "offset": offset, "cap": cap, "exp": int(time.time()) + settings.page_token_ttl}
+    body = _b64(json.dumps(payload, ensure_ascii=False).encode())
+    return f"{body}.{_sign(body)}"
+
+
+def decode_page_token(token: str):
+    """Retorna (sql, offset, cap). Levanta ValueError se o token for inválido ou expirado."""
+    try:
+        body, signature = token.split(".", 1)
+    except ValueError:
+        raise ValueError("Token de página malformado.")
+
+    if not hmac.compare_digest(signature, _sign(body)):
+        raise ValueError("Token de página inválido.")
+
+    payload = json.loads(_unb64(body))
+
+    if payload.get("exp", 0) < time.time():
+        raise ValueError("Token de página expirado.")
+
+    return payload["sql"], int(payload["offset"]), int(payload.get("cap", settings.sql_auto_limit))
@@ -1,12 +1,41 @@
-from fastapi import APIRouter, HTTPException
+import json
+import time
+import asyncio
+from typing import List
+from types import MappingProxyType
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from app.agents.query_agent.sql_generator import generate_sql
-from app.db.connection import get_connection
+from app.agents.query_agent.sql_generator import (
+    build_tables_context,
+    build_tables_context_batch,
+    agenerate_sql_from_context,
+)
+from app.db.connection import execute_sql, stream_sql, pool_stats
+from app.db.guards import has_order_by
+from app.api.pagination import encode_page_token, decode_page_token
+from app.db.result_cache import result_cache
+from app.agents.llm.completion_cache import completion_cache
 from app.agents.postprocessing_agent.formatter import format_table
-from app.agents.postprocessing_agent.answer_agent import generate_llm_answer_from_docs
+from app.agents.postprocessing_agent.answer_agent import (
+    generate_llm_answer,
+    generate_llm_answer_from_docs,
+    build_answer_prompt,
+    build_docs_prompt,
+    stream_llm_answer,
+    FALLBACK_ANSWERS,
+)
+from app.agents.query_agent.semantic_cache import semantic_cache
 
-from app.agents.mapping_agent.retriever import vector_search
+from app.agents.mapping_agent.retriever import docs_search, reload_classifier, classifier_info
+from app.agents.nlp_agent.nlp_utils import normalize_question
+from app.core.concurrency import run_in_stage
+from app.core.config import settings
+from app.core.metrics import stage_timer, observe_stage, metrics_response
+from app.core.warmup import is_ready, warmup_status
+from app.core.models import model_stats
 
 
 router = APIRouter()
@@ -15,22 +44,332 @@ class QueryIn(BaseModel):
     question: str
 
 
+class QueryBatchIn(BaseModel):
+    questions: List[str]
+    stream: bool = False
+
+
+class PageIn(BaseModel):
+    token: str
+
+
+class CacheInvalidateIn(BaseModel):
+    tables: List[str] = []  # vazio = invalida tudo
+
+
 @router.get("/")
 def root():
     return {"status": "ok"}
 
+
+@router.get("/ready")
+def ready():
+    """Readiness probe: 503 até o aquecimento terminar."""
+    return JSONResponse(warmup_status(), status_code=200 if is_ready() else 503)
+
+
+@router.get("/models")
+def models():
+    """Modelos de embedding carregados: tempo de carga e memória aproximada."""
+    return model_stats()
+
+
+@router.get("/metrics")
+def metrics():
+    content, content_type = metrics_response()
+    return Response(content=content, media_type=content_type)
+
+# ==========================================
+# PRAZO E DESCONEXÃO DO CLIENTE
+# ==========================================
+DEADLINE_DETAIL = "Tempo limite da requisição excedido."
+
+
+async def run_guarded(request: Request, coro, deadline=None):
+    """
+    Executa a corrotina da requisição e a cancela se o cliente desconectar
+    ou se o prazo (segundos) expirar. O cancelamento chega até o
+    PostgreSQL (stream_sql cancela a consulta no servidor).
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(coro)
+    expires = loop.time() + deadline if deadline else None
+
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.disconnect_poll_interval)
+            if done:
+                return task.result()
+
+            if await request.is_disconnected():
+                print("[API] Cliente desconectou; cancelando a requisição.")
+                raise HTTPException(status_code=499, detail="Cliente desconectou.")
+
+            if expires is not None and loop.time() >= expires:
+                raise HTTPException(status_code=504, detail=DEADLINE_DETAIL)
+    finally:
+        if not task.done():
+            task.cancel()
+            # dá tempo para o cancelamento no servidor terminar
+            await asyncio.wait({task}, timeout=5)
+
+
+async def with_deadline(events, deadline, on_timeout):
+    """
+    Repassa os itens de um gerador assíncrono (SSE/NDJSON) até o prazo
+    (segundos). Ao expirar, o passo em andamento é cancelado (a consulta no
+    PostgreSQL junto) e o stream termina com o item de on_timeout().
+    """
+    loop = asyncio.get_running_loop()
+    expires = loop.time() + deadline if deadline else None
+
+    try:
+        while True:
+            timeout = None if expires is None else max(0.0, expires - loop.time())
+            try:
+                item = await asyncio.wait_for(events.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                print("[API] Prazo do stream expirou; cancelando a requisição.")
+                yield on_timeout()
+                return
+            yield item
+    finally:
+        await events.aclose()
+
+
 @router.post("/query")
-async def query(payload: QueryIn):
-    question = payload.question.strip()
+async def query(payload: QueryIn, request: Request):
+    return await run_guarded(
+        request, process_query(payload.question.strip()), deadline=settings.query_deadline
+    )
+
+
+async def process_query(question: str):
+    emb = None
+    if settings.semantic_cache_enabled:
+        emb = await run_in_stage("retrieval", semantic_cache.embed, question)
+        cached = await cached_result(question, emb)
+        if cached:
+            return cached
+
+    mapped = await run_in_stage("retrieval", build_tables_context, question)
+    result = await answer_question(question, mapped)
+
+    remember(question, emb, result)
+    return result
+
+
+# ==========================================
+# EXECUÇÃO SQL (com cache de resultados)
+# ==========================================
+async def run_sql(sql: str, offset: int = 0, cap: int = None):
+    """
+    Retorna (colunas, linhas, has_more) de uma página do resultado,
+    usando o cache de resultados quando possível. `cap` é o teto de
+    linhas do token de página (padrão settings.sql_auto_limit).
+    """
+    if not settings.sql_cache_enabled or cap not in (None, settings.sql_auto_limit):
+        with stage_timer("db_execution"):
+            return await execute_sql(sql, offset=offset, cap=cap)
+
+    cached = result_cache.get(sql, offset=offset)
+    if cached is not None:
+        return cached
+
+    snapshot = result_cache.snapshot(sql)
+    with stage_timer("db_execution"):
+        cols, rows, has_more = await execute_sql(sql, offset=offset)
+    result_cache.put(sql, cols, rows, has_more=has_more, offset=offset, snapshot=snapshot)
+    return cols, rows, has_more
+
+
+def _at_cap(offset: int, has_more: bool, cap: int) -> bool:
+    """O resultado tem mais linhas, mas a próxima página já passaria do teto SQL_AUTO_LIMIT."""
+    return bool(has_more and cap and offset >= cap)
+
+
+def next_page_token(sql: str, offset: int, has_more: bool, cap: int = None):
+    """
+    Token da próxima página, ou None se o resultado acabou, foi cortado no
+    teto ou se o SQL não tem ORDER BY externo (páginas por offset sem ordem
+    estável podem repetir ou pular linhas).
+    """
+    cap = settings.sql_auto_limit if cap is None else cap
+    if not has_more or _at_cap(offset, has_more, cap) or not has_order_by(sql):
+        return None
+    return encode_page_token(sql, offset, cap)
+
+
+def page_fields(sql: str, offset: int, has_more: bool, cap: int = None) -> dict:
+    """
+    Campos de paginação da resposta. has_more diz se existem mais linhas;
+    truncated=True quando existem mas não há next_token para buscá-las
+    (truncated_reason: "row_cap" = passou do SQL_AUTO_LIMIT,
+    "unordered" = SQL sem ORDER BY externo).
+    """
+    cap = settings.sql_auto_limit if cap is None else cap
+    token = next_page_token(sql, offset, has_more, cap)
+
+    reason = None
+    if has_more and token is None:
+        reason = "row_cap" if _at_cap(offset, has_more, cap) else "unordered"
+
+    return {
+        "next_token": token,
+        "has_more": bool(has_more),
+        "truncated": reason is not None,
+        "truncated_reason": reason
+    }
+
+
+@router.post("/query/page")
+async def query_page(payload: PageIn, request: Request):
+    """Próxima página de um resultado de /query (via next_token)."""
+    try:
+        sql, offset, cap = decode_page_token(payload.token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        cols, rows, has_more = await run_guarded(
+            request, run_sql(sql, offset=offset, cap=cap), deadline=settings.query_deadline
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao executar SQL: {e}")
+
+    return {
+        "columns": cols,
+        "rows": rows,
+        "offset": offset,
+        **page_fields(sql, offset + len(rows), has_more, cap)
+    }
+
+
+@router.get("/db/pool")
+def db_pool_stats():
+    return pool_stats()
+
+
+@router.get("/cache/sql")
+def sql_cache_stats():
+    return result_cache.stats()
+
+
+@router.post("/cache/sql/invalidate")
+def sql_cache_invalidate(payload: CacheInvalidateIn):
+    removed = result_cache.invalidate(payload.tables)
+    return {"removed": removed, "tables": payload.tables or "*"}
+
+
+@router.get("/classifier")
+def classifier_status():
+    return classifier_info()
+
+
+@router.post("/classifier/reload")
+async def classifier_reload():
+    """Força a recarga do table_classifier.joblib (ex.: após retreino)."""
+    await run_in_stage("retrieval", reload_classifier, True)
+    return classifier_info()
+
+
+@router.get("/cache/llm")
+def llm_cache_stats():
+    return completion_cache.stats()
+
+
+@router.post("/cache/llm/clear")
+async def llm_cache_clear():
+    removed = await run_in_stage("llm_cache", completion_cache.clear)
+    return {"removed": removed}
+
+
+# ==========================================
+# SEMANTIC CACHE
+# ==========================================
+async def cached_result(question: str, emb):
+    """
+    Procura uma pergunta parecida no semantic cache. Re-executa o SQL
+    quando configurado (ou quando as linhas não foram guardadas) e só
+    chama a LLM de novo se as linhas mudaram.
+    """
+    with stage_timer("semantic_cache_lookup"):
+        hit = semantic_cache.lookup(emb, question)
+    if hit is None:
+        return None
+
+    result = hit["result"]
+    sql = result.get("sql")
+
+    # alguma tabela do SQL foi invalidada depois que a entrada foi guardada
+    stale = hit["tables"] is not None and not result_cache.is_current(hit["tables"])
+
+    if sql and (settings.semantic_cache_reexecute or stale or "rows" not in result):
+        try:
+            cols, rows, has_more = await run_sql(sql)
+        except Exception:
+            return None  # SQL antigo não roda mais: refaz o pipeline
+
+        if not rows:
+            return None
+
+        old_rows = result.get("rows")
+        if old_rows is None or [tuple(r) for r in rows] != [tuple(r) for r in old_rows]:
+            result["answer"] = await generate_llm_answer(question, cols, rows, partial=has_more)
+
+        result["columns"] = cols
+        result["rows"] = rows
+        result.update(page_fields(sql, len(rows), has_more))
+
+    elif result.get("has_more") or result.get("next_token"):
+        # token novo: o guardado pode ter expirado
+        result.update(page_fields(sql, len(result["rows"]), True))
+
+    result["cache"] = {
+        "hit": True,
+        "question": hit["question"],
+        "similarity": round(hit["similarity"], 4)
+    }
+    return result
+
+
+def remember(question: str, emb, result: dict):
+    """
+    Guarda no semantic cache apenas respostas úteis (com linhas ou documentos),
+    junto com as versões das tabelas lidas (result["_tables"], sempre removido).
+    """
+    tables = result.pop("_tables", None)
+    if emb is None:
+        return
+    if result.get("answer") in FALLBACK_ANSWERS:
+        return
+    if not (result.get("rows") or result.get("docs")):
+        return
+
+    semantic_cache.store(question, emb, result, tables=tables)
+
+
+async def answer_question(question: str, mapped: dict):
+    """
+    Pipeline a partir das tabelas já mapeadas: SQL → execução → resposta.
+    Compartilhado por /query e /query/batch.
+    """
 
     # ------------------------------------------
-    # 1) Gera SQL
+    # 1) Gera SQL (LLM no pool próprio)
     # ------------------------------------------
-    sql = generate_sql(question)
+    sql = await agenerate_sql_from_context(question, mapped)
 
-    # Caso SQL seja None = LLM decidiu usar docs
+    # Caso SQL seja None = a pergunta foi roteada para documentos
     if not sql:
-        docs = vector_search(question, top_k=3)
+        if mapped["type"] == "doc":
+            docs = mapped["items"]
+        else:
+            docs = await run_in_stage("retrieval", docs_search, question, top_k=settings.docs_top_k)
 
         if docs:
             answer = await generate_llm_answer_from_docs(question, docs)
@@ -50,42 +389,33 @@ async def query(payload: QueryIn):
     # ------------------------------------------
     # 2) Executa SQL normalmente
     # ------------------------------------------
+    # versões das tabelas antes de executar (para o semantic cache)
+    tables = result_cache.snapshot(sql)
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(sql)
-
-        raw_rows = cur.fetchall() if cur.description else []
-        cols = [d[0] for d in cur.description] if cur.description else []
-
+        cols, raw_rows, has_more = await run_sql(sql)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao executar SQL: {e}")
 
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except:
-            pass
-
     # ------------------------------------------
     # 3) Caso tenha linhas => usa SQL
     # ------------------------------------------
     if raw_rows:
-        final_answer = await generate_llm_answer(question, cols, raw_rows)
+        final_answer = await generate_llm_answer(question, cols, raw_rows, partial=has_more)
 
         return {
             "sql": sql,
             "columns": cols,
             "rows": raw_rows,
+            **page_fields(sql, len(raw_rows), has_more),
             "answer": final_answer,
-            "rag_used": False
+            "rag_used": False,
+            "_tables": tables
         }
 
     # ------------------------------------------
     # 4) Senão tenta documentos
     # ------------------------------------------
-    docs = vector_search(question, top_k=3)
+    docs = await run_in_stage("retrieval", docs_search, question, top_k=settings.docs_top_k)
 
     if docs:
         answer = await generate_llm_answer_from_docs(question, docs)
@@ -107,4 +437,297 @@ async def query(payload: QueryIn):
         "rows": [],
         "answer": "Nenhum dado encontrado e nenhum documento relacionado.",
         "rag_used": False
-    }
\ No newline at end of file
+    }
+
+
+# ==========================================
+# LOTE DE PERGUNTAS
+# ==========================================
+@router.post("/query/batch")
+async def query_batch(payload: QueryBatchIn, request: Request):
+    questions = [q.strip() for q in payload.questions]
+
+    if len(questions) > settings.batch_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {settings.batch_max_questions} perguntas por lote."
+        )
+
+    # ------------------------------------------
+    # 1) Deduplica perguntas idênticas
+    # ------------------------------------------
+    unique = {}   # pergunta normalizada -> primeira ocorrência
+    indexes = {}  # pergunta normalizada -> posições no lote
+    for i, q in enumerate(questions):
+        key = normalize_question(q)
+        unique.setdefault(key, q)
+        indexes.setdefault(key, []).append(i)
+
+    keys = list(unique)
+
+    # ------------------------------------------
+    # 2) Semantic cache (embeddings em lote)
+    # ------------------------------------------
+    embs = {}
+    cached = {}
+    if settings.semantic_cache_enabled and keys:
+        vectors = await run_in_stage(
+            "retrieval", semantic_cache.embed_batch, [unique[k] for k in keys]
+        )
+        embs = dict(zip(keys, vectors))
+
+        # com SEMANTIC_CACHE_REEXECUTE=1 cada hit volta ao banco:
+        # no máximo uma consulta por conexão do pool
+        db_slots = asyncio.Semaphore(max(1, settings.db_pool_max))
+
+        async def lookup(key):
+            async with db_slots:
+                return await cached_result(unique[key], embs[key])
+
+        hits = await asyncio.gather(*(lookup(k) for k in keys))
+        cached = {k: hit for k, hit in zip(keys, hits) if hit}
+
+    pending = [k for k in keys if k not in cached]
+
+    # ------------------------------------------
+    # 3) Retrieval em lote (um encode, um col.query)
+    # ------------------------------------------
+    mapped_list = []
+    if pending:
+        mapped_list = await run_in_stage(
+            "retrieval", build_tables_context_batch, [unique[k] for k in pending]
+        )
+    mapped_by_key = dict(zip(pending, mapped_list))
+
+    # ------------------------------------------
+    # 4) SQL + execução + resposta com paralelismo limitado
+    # ------------------------------------------
+    semaphore = asyncio.Semaphore(max(1, settings.batch_concurrency))
+
+    async def solve(key):
+        if key in cached:
+            return key, cached[key]
+
+        async with semaphore:
+            try:
+                mapped = mapped_by_key.get(key)
+                if mapped is None:
+                    raise Exception("Nenhuma tabela ou documento encontrado")
+                result = await answer_question(unique[key], mapped)
+            except HTTPException as e:
+                return key, {"error": e.detail}
+            except Exception as e:
+                return key, {"error": str(e)}
+
+        remember(unique[key], embs.get(key), result)
+        return key, result
+
+    tasks = [asyncio.ensure_future(solve(k)) for k in keys]
+
+    def items_for(key, result):
+        return [
+            {"index": i, "question": questions[i], **result}
+            for i in indexes[key]
+        ]
+
+    # Streaming: um JSON por linha conforme cada pergunta termina
+    if payload.stream:
+        async def ndjson():
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    key, result = await fut
+                    for item in items_for(key, result):
+                        yield json.dumps(item, ensure_ascii=False, default=json_default) + "\n"
+            finally:
+                # cliente desconectou no meio do stream: cancela o que falta
+                for task in tasks:
+                    task.cancel()
+
+        def timeout_line():
+            return json.dumps({"error": DEADLINE_DETAIL}, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(
+            with_deadline(ndjson(), settings.query_deadline, timeout_line),
+            media_type="application/x-ndjson"
+        )
+
+    results = []
+    for key, result in await run_guarded(request, asyncio.gather(*tasks)):
+        results.extend(items_for(key, result))
+
+    results.sort(key=lambda r: r["index"])
+    return {"results": results}
+
+
+# ==========================================
+# STREAMING (Server-Sent Events)
+# ==========================================
+STREAM_ROWS_CHUNK = 200
+
+
+def json_default(value):
+    # registros do catálogo são somente leitura (MappingProxyType)
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    return str(value)
+
+
+def sse_event(event: str, data) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=json_default)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def iter_sql_page(sql: str):
+    """
+    Primeira página do SQL em lotes, direto do cursor server-side
+    (ou do cache de resultados): ("columns", ...), ("rows", lote)..., ("more", bool).
+    """
+    if settings.sql_cache_enabled:
+        cached = result_cache.get(sql)
+        if cached is not None:
+            cols, rows, has_more = cached
+            yield "columns", cols
+            for i in range(0, len(rows), STREAM_ROWS_CHUNK):
+                yield "rows", rows[i:i + STREAM_ROWS_CHUNK]
+            yield "more", has_more
+            return
+
+    snapshot = result_cache.snapshot(sql)
+    cols, rows = [], []
+    start = time.perf_counter()
+
+    async for kind, value in stream_sql(sql):
+        if kind == "columns":
+            cols = value
+        elif kind == "rows":
+            rows.extend(value)
+        else:
+            observe_stage("db_execution", time.perf_counter() - start)
+            if settings.sql_cache_enabled:
+                result_cache.put(sql, cols, rows, has_more=value, snapshot=snapshot)
+        yield kind, value
+
+
+async def stream_query_events(question: str):
+    """
+    Mesmo fluxo do /query, mas emitindo um evento a cada etapa concluída:
+    tables → sql → columns → rows (em blocos) → more → token (resposta) → done.
+    Num hit do semantic cache: cache → sql → columns → rows → token → done.
+    """
+    try:
+        emb = None
+        if settings.semantic_cache_enabled:
+            emb = await run_in_stage("retrieval", semantic_cache.embed, question)
+            cached = await cached_result(question, emb)
+            if cached:
+                yield sse_event("cache", cached["cache"])
+                yield sse_event("sql", {"sql": cached.get("sql")})
+                if cached.get("sql"):
+                    rows = cached.get("rows") or []
+                    yield sse_event("columns", {"columns": cached.get("columns") or []})
+                    for i in range(0, len(rows), STREAM_ROWS_CHUNK):
+                        yield sse_event("rows", {"rows": rows[i:i + STREAM_ROWS_CHUNK]})
+                    if cached.get("has_more") or cached.get("next_token"):
+                        yield sse_event("more", {
+                            "next_token": cached.get("next_token"),
+                            "has_more": True,
+                            "truncated": cached.get("truncated", False),
+                            "truncated_reason": cached.get("truncated_reason")
+                        })
+                if cached.get("docs"):
+                    yield sse_event("docs", {"docs": cached["docs"]})
+                yield sse_event("token", {"token": cached.get("answer", "")})
+                yield sse_event("done", {"rag_used": cached.get("rag_used", False)})
+                return
+
+        mapped = await run_in_stage("retrieval", build_tables_context, question)
+        yield sse_event("tables", {
+            "type": mapped["type"],
+            "tables": [
+                {"id": t.get("id"), "score": t.get("score")}
+                for t in mapped["items"]
+            ]
+        })
+
+        sql = await agenerate_sql_from_context(question, mapped)
+        yield sse_event("sql", {"sql": sql})
+
+        cols, raw_rows, paging = [], [], page_fields(sql or "", 0, False)
+        tables = None
+        if sql:
+            tables = result_cache.snapshot(sql)
+            try:
+                async for kind, value in iter_sql_page(sql):
+                    if kind == "columns":
+                        cols = value
+                        yield sse_event("columns", {"columns": cols})
+                    elif kind == "rows":
+                        raw_rows.extend(value)
+                        yield sse_event("rows", {"rows": value})
+                    else:
+                        paging = page_fields(sql, len(raw_rows), value)
+            except Exception as e:
+                yield sse_event("error", {"detail": f"Erro ao executar SQL: {e}"})
+                return
+
+            if paging["has_more"]:
+                yield sse_event("more", paging)
+
+        # Com linhas => explica o SQL; senão tenta documentos
+        docs = None
+        if raw_rows:
+            prompt = build_answer_prompt(question, cols, raw_rows, partial=paging["has_more"])
+            rag_used = False
+        else:
+            if mapped["type"] == "doc":
+                docs = mapped["items"]
+            else:
+                docs = await run_in_stage("retrieval", docs_search, question, top_k=settings.docs_top_k)
+            if not docs:
+                yield sse_event("token", {"token": "Nenhum dado encontrado e nenhum documento relacionado."})
+                yield sse_event("done", {"rag_used": sql is None})
+                return
+
+            yield sse_event("docs", {"docs": docs})
+            prompt = build_docs_prompt(question, docs)
+            rag_used = True
+
+        answer = []
+        status = {"failed": False}
+        async for token in stream_llm_answer(prompt, status):
+            answer.append(token)
+            yield sse_event("token", {"token": token})
+
+        yield sse_event("done", {"rag_used": rag_used})
+
+        if status["failed"]:
+            return  # resposta parcial + fallback: não vai para o semantic cache
+
+        result = {
+            "sql": sql,
+            "columns": cols,
+            "rows": raw_rows,
+            **paging,
+            "answer": "".join(answer),
+            "rag_used": rag_used,
+            "_tables": tables
+        }
+        if docs:
+            result["docs"] = docs
+        remember(question, emb, result)
+
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+
+
+@router.post("/query/stream")
+async def query_stream(payload: QueryIn):
+    return StreamingResponse(
+        with_deadline(
+            stream_query_events(payload.question.strip()),
+            settings.query_deadline,
+            lambda: sse_event("error", {"detail": DEADLINE_DETAIL})
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
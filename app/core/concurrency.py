@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+
+
+# -------------------------------------------
+# POOLS POR ETAPA DO PIPELINE
+# -------------------------------------------
+# Cada etapa bloqueante do /query roda no seu próprio pool, fora do
+# event loop. O tamanho do pool é o limite de concorrência da etapa:
+# chamadas excedentes ficam na fila do executor sem travar as demais.
+# (O PostgreSQL e o Ollama usam clientes assíncronos; o limite é o pool
+# de conexões / settings.llm_max_concurrency.)
+STAGE_WORKERS = {
+    "retrieval": settings.retrieval_workers,  # embedding + Chroma + classificador
+    "docs": settings.docs_workers,            # busca em external_docs, em paralelo com o schema
+    "llm_cache": settings.llm_cache_workers,  # SQLite do cache de completions
+}
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_executor(stage: str) -> ThreadPoolExecutor:
+    """Retorna (criando sob demanda) o executor da etapa."""
+    executor = _executors.get(stage)
+    if executor is not None:
+        return executor
+
+    if stage not in STAGE_WORKERS:
+        raise ValueError(f"Etapa desconhecida: {stage}")
+
+    with _lock:
+        executor = _executors.get(stage)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=max(1, STAGE_WORKERS[stage]),
+                thread_name_prefix=f"{stage}-worker"
+            )
+            _executors[stage] = executor
+    return executor
+
+
+async def run_in_stage(stage: str, fn, *args, **kwargs):
+    """
+    Executa fn(*args, **kwargs) no pool da etapa e aguarda sem bloquear o loop.
+    O contexto (contextvars) da requisição é propagado para a thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(stage), call)
+
+
+def submit_in_stage(stage: str, fn, *args, **kwargs):
+    """
+    Versão síncrona do run_in_stage para código que já roda numa thread
+    (ex.: o retrieval disparando a busca de documentos em paralelo).
+    Retorna um concurrent.futures.Future; o contexto é propagado.
+    """
+    ctx = contextvars.copy_context()
+    return get_executor(stage).submit(ctx.run, fn, *args, **kwargs)
+
+
+def shutdown_executors():
+    """Encerra todos os pools (usado no shutdown da API)."""
+    with _lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
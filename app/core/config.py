@@ -1,4 +1,5 @@
 import os
+import secrets
 
 class Settings:
  def __init__(self):
@@ -10,10 +11,32 @@ class Settings:
 
   embed_model_path = os.getenv("MODEL_PATH","D:\Faculdade\8_fase\TCC\Inteligencia-Personalizada\Inteligencia-Personalizada\Modelos\multilingual-e5-base")
   self.embed_model_path=embed_model_path
+  # Modelo de embeddings do classificador de tabelas
+  self.classifier_embed_model = os.getenv("CLASSIFIER_EMBED_MODEL", "all-MiniLM-L6-v2")
+  # Busca vetorial do schema: "chroma" (HNSW) ou "numpy" (exata, matriz em memmap)
+  self.vector_backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+  self.vector_index_dtype = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # ou float16
+  # Busca lexical (BM25) combinada com a vetorial por RRF
+  self.lexical_search_enabled = os.getenv("LEXICAL_SEARCH_ENABLED", "1") == "1"
+  self.rrf_k = int(os.getenv("RRF_K", "60"))
+  # Busca pelas tags/glossário pré-codificados (também entra no RRF)
+  self.tag_search_enabled = os.getenv("TAG_SEARCH_ENABLED", "1") == "1"
+  # Documentos externos (coleção própria) e roteamento tabelas x documentos
+  self.docs_top_k = int(os.getenv("DOCS_TOP_K", "3"))
+  self.docs_route_margin = float(os.getenv("DOCS_ROUTE_MARGIN", "0.05"))  # distância de cosseno
+  # LRU de embeddings de perguntas (entradas por modelo; 0 desliga)
+  self.embed_cache_size = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
 
   # Llama Server (Ollama)
   llama_server = os.getenv("LLAMA_SERVER", "http://localhost:11434")
   self.llama_server = llama_server.rstrip("/")  # remove / final para evitar erro
+  self.llm_model = os.getenv("LLM_MODEL", "llama3.1")
+  # Cliente HTTP do Ollama (conexões persistentes, retry com backoff)
+  self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+  self.llm_connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+  self.llm_read_timeout = float(os.getenv("LLM_READ_TIMEOUT", "300"))
+  self.llm_retries = int(os.getenv("LLM_RETRIES", "3"))
+  self.llm_backoff_base = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # segundos
 
   # ChromaDB directory
   self.chroma_dir = os.getenv("CHROMA_DIR", "./chroma_store")
@@ -23,4 +46,63 @@ class Settings:
   # Default schema for metadata extractor
   self.schema = os.getenv("DB_SCHEMA", "sisplan")
 
+  # Pool assíncrono do PostgreSQL (psycopg 3)
+  self.db_pool_min = int(os.getenv("DB_POOL_MIN", "1"))
+  self.db_pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+  self.db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+  # Resultados SQL: cursor server-side, linhas por resposta e paginação
+  self.sql_max_rows = int(os.getenv("SQL_MAX_ROWS", "1000"))
+  self.sql_fetch_batch = int(os.getenv("SQL_FETCH_BATCH", "500"))
+  # Proteções de execução do SQL gerado
+  self.sql_statement_timeout_ms = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "30000"))
+  self.sql_auto_limit = int(os.getenv("SQL_AUTO_LIMIT", "10000"))  # 0 = sem LIMIT automático
+  self.query_deadline = float(os.getenv("QUERY_DEADLINE", "600"))   # segundos por requisição
+  self.disconnect_poll_interval = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+  # com vários workers do uvicorn, defina o mesmo segredo em todos
+  self.page_token_secret = os.getenv("PAGE_TOKEN_SECRET") or secrets.token_hex(32)
+  self.page_token_ttl = int(os.getenv("PAGE_TOKEN_TTL", "3600"))
+
+  # Contexto de schema no prompt do SQL: colunas ranqueadas pela pergunta
+  self.sql_context_token_budget = int(os.getenv("SQL_CONTEXT_TOKEN_BUDGET", "1200"))  # 0 = todas as colunas
+  self.sql_context_min_columns = int(os.getenv("SQL_CONTEXT_MIN_COLUMNS", "5"))      # por tabela, além das chaves
+  self.sql_context_embed_weight = float(os.getenv("SQL_CONTEXT_EMBED_WEIGHT", "0.5"))  # peso do embedding x lexical
+
+  # Cache persistente de completions do LLM (SQLite)
+  self.llm_cache_enabled = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+  self.llm_cache_path = os.getenv("LLM_CACHE_PATH", os.path.join(self.chroma_dir, "llm_cache.sqlite"))
+  self.llm_cache_ttl = int(os.getenv("LLM_CACHE_TTL", "86400"))
+  self.llm_cache_max_mb = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+  self.llm_cache_purposes = [p.strip() for p in os.getenv("LLM_CACHE_PURPOSES", "sql").split(",") if p.strip()]
+
+  # Concorrência do /query: um pool de threads por etapa
+  self.retrieval_workers = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+  self.docs_workers = int(os.getenv("DOCS_WORKERS", "4"))
+  self.llm_cache_workers = int(os.getenv("LLM_CACHE_WORKERS", "4"))
+
+  # Aquecimento no startup (o /ready só responde 200 depois dele)
+  self.warmup_enabled = os.getenv("WARMUP_ENABLED", "1") == "1"
+  self.warmup_retry_interval = float(os.getenv("WARMUP_RETRY_INTERVAL", "10"))
+  self.llama_keep_alive = os.getenv("LLAMA_KEEP_ALIVE", "30m")  # tempo que o Ollama mantém o modelo carregado
+
+  # /query/batch
+  self.batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+  self.batch_max_questions = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+
+  # Semantic cache (pergunta parecida => reaproveita SQL/resposta)
+  self.semantic_cache_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+  self.semantic_cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+  self.semantic_cache_ttl = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+  self.semantic_cache_max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+  self.semantic_cache_max_rows = int(os.getenv("SEMANTIC_CACHE_MAX_ROWS", "1000"))
+  self.semantic_cache_reexecute = os.getenv("SEMANTIC_CACHE_REEXECUTE", "0") == "1"
+
+  # Cache de resultados SQL (colunas + linhas por SQL normalizado)
+  self.sql_cache_enabled = os.getenv("SQL_CACHE_ENABLED", "1") == "1"
+  self.sql_cache_ttl = int(os.getenv("SQL_CACHE_TTL", "300"))
+  self.sql_cache_max_mb = int(os.getenv("SQL_CACHE_MAX_MB", "256"))
+  # contadores de invalidação por tabela, compartilhados entre os workers
+  self.sql_cache_versions_path = os.getenv("SQL_CACHE_VERSIONS_PATH", os.path.join(self.chroma_dir, "sql_cache_versions.sqlite"))
+  self.sql_cache_version_poll = float(os.getenv("SQL_CACHE_VERSION_POLL", "1"))  # segundos
+
 settings = Settings()
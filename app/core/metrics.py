@@ -0,0 +1,167 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+# -------------------------------------------
+# MÉTRICAS PROMETHEUS
+# -------------------------------------------
+STAGE_LATENCY = Histogram(
+    "query_stage_seconds",
+    "Latência de cada etapa do pipeline de perguntas",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second",
+    "Velocidade de geração do LLM (tokens/s, eval_count / eval_duration do Ollama)",
+    ["purpose"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200)
+)
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Tempo até o primeiro token nas chamadas em streaming",
+    ["purpose"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+)
+
+LLM_EARLY_STOPS = Counter(
+    "llm_early_stops_total",
+    "Chamadas em streaming encerradas antes do fim (ex.: SQL já completo)",
+    ["purpose"]
+)
+
+LLM_PROMPT_EVAL = Histogram(
+    "llm_prompt_eval_seconds",
+    "Tempo de processamento do prompt no Ollama (prompt_eval_duration)",
+    ["purpose"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+
+LLM_PROMPT_TOKENS = Counter(
+    "llm_prompt_eval_tokens_total",
+    "Tokens de prompt efetivamente processados (o prefixo reaproveitado do cache não conta)",
+    ["purpose"]
+)
+
+LLM_TOKENS = Counter(
+    "llm_generated_tokens_total",
+    "Tokens gerados pelo LLM",
+    ["purpose"]
+)
+
+SQL_CONTEXT_TOKENS = Histogram(
+    "sql_context_tokens",
+    "Tokens estimados do contexto de schema enviado no prompt do SQL",
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000)
+)
+
+SQL_CONTEXT_TOKENS_SAVED = Counter(
+    "sql_context_tokens_saved_total",
+    "Tokens estimados economizados pelo orçamento do contexto de schema"
+)
+
+# Tempos da requisição atual ({etapa: segundos}), para o Server-Timing.
+# O dict é compartilhado com as threads via contextvars (run_in_stage).
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> dict:
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """with stage_timer("db_execution"): ... — registra a duração da etapa."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_llm_response(purpose: str, data: dict):
+    """Registra tokens, tokens/s e processamento do prompt a partir da resposta final do Ollama."""
+    count = data.get("eval_count") or 0
+    duration_ns = data.get("eval_duration") or 0
+    prompt_count = data.get("prompt_eval_count") or 0
+    prompt_ns = data.get("prompt_eval_duration") or 0
+
+    if prompt_count:
+        LLM_PROMPT_TOKENS.labels(purpose).inc(prompt_count)
+    if prompt_ns:
+        LLM_PROMPT_EVAL.labels(purpose).observe(prompt_ns / 1e9)
+
+        timings = _request_timings.get()
+        if timings is not None:
+            key = f"{purpose}_prompt_eval"
+            timings[key] = timings.get(key, 0.0) + prompt_ns / 1e9
+
+    if count:
+        LLM_TOKENS.labels(purpose).inc(count)
+    if count and duration_ns:
+        LLM_TOKENS_PER_SECOND.labels(purpose).observe(count / (duration_ns / 1e9))
+
+
+def observe_llm_stream(purpose: str, ttft: float, tokens: int, seconds: float, early_stop: bool):
+    """
+    Métricas de uma chamada em streaming, medidas no cliente: tempo até o
+    primeiro token e tokens/s (vale também quando a leitura é interrompida
+    e o Ollama não chega a mandar eval_count/eval_duration).
+    """
+    if ttft is not None:
+        LLM_TIME_TO_FIRST_TOKEN.labels(purpose).observe(ttft)
+
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[f"{purpose}_ttft"] = timings.get(f"{purpose}_ttft", 0.0) + ttft
+
+    if early_stop:
+        LLM_EARLY_STOPS.labels(purpose).inc()
+        # sem o chunk final do Ollama: contabiliza pelo que foi lido
+        if tokens:
+            LLM_TOKENS.labels(purpose).inc(tokens)
+        if tokens and seconds > 0:
+            LLM_TOKENS_PER_SECOND.labels(purpose).observe(tokens / seconds)
+
+
+def server_timing_header(timings: dict, total: float = None) -> str:
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def metrics_response():
+    """
+    (conteúdo, content-type) para o /metrics. Com vários workers do
+    uvicorn, defina PROMETHEUS_MULTIPROC_DIR para agregar os processos.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(), CONTENT_TYPE_LATEST
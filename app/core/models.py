@@ -0,0 +1,182 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import stage_timer
+
+
+# -------------------------------------------
+# REGISTRO DE MODELOS DE EMBEDDING
+# -------------------------------------------
+# Cada SentenceTransformer é carregado uma única vez por processo, no
+# primeiro uso, e compartilhado por todos os módulos (retriever, indexer,
+# tagging, glossário, classificador...). Antes, cada import instanciava
+# o seu próprio modelo.
+EMBED_MODEL = settings.embed_model_path              # multilingual-e5-base
+CLASSIFIER_EMBED_MODEL = settings.classifier_embed_model  # all-MiniLM-L6-v2
+
+_models = {}
+_stats = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _model_bytes(model) -> int:
+    """Memória aproximada do modelo (soma dos parâmetros e buffers)."""
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return int(total)
+    except Exception:
+        return 0
+
+
+def get_model(name: str):
+    """Retorna o SentenceTransformer `name`, carregando-o na primeira chamada."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+
+    # lock por modelo: carregar um não bloqueia quem usa outro
+    with lock:
+        model = _models.get(name)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            start = time.perf_counter()
+            model = SentenceTransformer(name)
+            seconds = time.perf_counter() - start
+            size = _model_bytes(model)
+
+            _stats[name] = {
+                "load_seconds": round(seconds, 3),
+                "memory_mb": round(size / (1024 * 1024), 1),
+                "loaded_at": time.time()
+            }
+            _models[name] = model
+            print(f"🧠 Modelo '{name}' carregado em {seconds:.1f}s (~{size / (1024 * 1024):.0f} MB)")
+
+    return model
+
+
+# -------------------------------------------
+# CACHE LRU DE EMBEDDINGS DE PERGUNTAS
+# -------------------------------------------
+# Uma mesma pergunta era codificada várias vezes por requisição (busca
+# vetorial, classificador, semantic cache, tags). Com o cache, cada
+# texto é codificado no máximo uma vez por modelo enquanto estiver no LRU.
+class EmbeddingCache:
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list) -> list:
+        with self._lock:
+            out = []
+            for key in keys:
+                emb = self._entries.get(key)
+                if emb is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                out.append(emb)
+            return out
+
+    def put_many(self, keys: list, embs):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            for key, emb in zip(keys, embs):
+                emb = np.array(emb, dtype=np.float32)
+                emb.setflags(write=False)  # compartilhado entre requisições
+                self._entries[key] = emb
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_embed_caches = {}
+
+
+def _embed_cache(name: str) -> EmbeddingCache:
+    cache = _embed_caches.get(name)
+    if cache is None:
+        with _registry_lock:
+            cache = _embed_caches.setdefault(name, EmbeddingCache(settings.embed_cache_size))
+    return cache
+
+
+def encode_cached(name: str, texts: list) -> np.ndarray:
+    """
+    model.encode(texts) com cache LRU por modelo. A chave é o texto com
+    espaços normalizados (o tokenizer os ignora, então o vetor é o mesmo).
+    Retorna uma matriz float32 (len(texts) x dim).
+    """
+    keys = [" ".join(str(t).split()) for t in texts]
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    cache = _embed_cache(name)
+    found = cache.get_many(keys)
+
+    missing = list(dict.fromkeys(k for k, emb in zip(keys, found) if emb is None))
+    if missing:
+        # só o encode real entra na métrica "embedding" (hits do LRU não)
+        model = get_model(name)
+        with stage_timer("embedding"):
+            embs = model.encode(missing, show_progress_bar=False)
+        cache.put_many(missing, embs)
+        computed = dict(zip(missing, embs))
+        found = [emb if emb is not None else computed[k] for k, emb in zip(keys, found)]
+
+    return np.asarray(np.stack(found), dtype=np.float32)
+
+
+class LazyModel:
+    """
+    Referência a um modelo do registro que só carrega no primeiro uso:
+    embedder = LazyModel(EMBED_MODEL); embedder.encode(...)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_model(self.name), attr)
+
+    def encode_cached(self, texts: list) -> np.ndarray:
+        return encode_cached(self.name, texts)
+
+
+def get_embedder():
+    return get_model(EMBED_MODEL)
+
+
+def get_classifier_embedder():
+    return get_model(CLASSIFIER_EMBED_MODEL)
+
+
+def model_stats() -> dict:
+    """Modelos carregados, com tempo de carga, memória e cache de embeddings."""
+    out = {}
+    for name, stats in _stats.items():
+        out[name] = dict(stats)
+        if name in _embed_caches:
+            out[name]["embedding_cache"] = _embed_caches[name].stats()
+    return out
@@ -0,0 +1,47 @@
+import os
+import time
+import threading
+
+from app.core.config import settings
+
+
+# -------------------------------------------
+# VERSÃO DO SCHEMA INDEXADO
+# -------------------------------------------
+# Arquivo-marcador no diretório do Chroma. O pipeline grava uma nova versão
+# a cada reindexação; caches em memória da API (em outros processos)
+# comparam a versão para saber quando se invalidar.
+VERSION_FILE = os.path.join(settings.chroma_dir, "schema_version")
+
+_lock = threading.Lock()
+_cached = {"mtime": None, "version": ""}
+
+
+def get_schema_version() -> str:
+    """Versão atual do schema indexado ("" se o pipeline nunca rodou)."""
+    try:
+        mtime = os.stat(VERSION_FILE).st_mtime_ns
+    except OSError:
+        return ""
+
+    with _lock:
+        if _cached["mtime"] != mtime:
+            try:
+                with open(VERSION_FILE, encoding="utf-8") as f:
+                    _cached["version"] = f.read().strip()
+            except OSError:
+                return ""
+            _cached["mtime"] = mtime
+        return _cached["version"]
+
+
+def bump_schema_version() -> str:
+    """Grava uma nova versão (chamado ao fim de cada indexação do schema)."""
+    version = str(time.time_ns())
+    tmp = VERSION_FILE + ".tmp"
+
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, VERSION_FILE)  # troca atômica para leitores concorrentes
+
+    return version
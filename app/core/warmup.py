@@ -0,0 +1,112 @@
+import time
+import asyncio
+
+from app.core.config import settings
+from app.core.concurrency import run_in_stage
+from app.agents.mapping_agent.retriever import get_chroma_collection, get_catalog, embedder, load_classifier
+from app.agents.llm.llama_api import awarmup_llama
+
+
+# -------------------------------------------
+# AQUECIMENTO NO STARTUP
+# -------------------------------------------
+# A primeira requisição depois de um deploy pagava a abertura do Chroma,
+# o carregamento do classificador (joblib + MiniLM), do modelo de
+# embeddings e do modelo no Ollama. O aquecimento faz tudo isso em
+# background logo no startup; o /ready só responde 200 quando termina,
+# para o load balancer não mandar tráfego a uma instância fria.
+WARMUP_TEXT = "aquecimento"
+
+_state = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "steps": {},  # etapa -> {"ok", "seconds", "note" | "error"}
+}
+
+
+def _warm_chroma():
+    try:
+        col = get_chroma_collection()
+    except Exception:
+        return "coleção db_schema ainda não indexada"
+
+    get_catalog(col)  # decodifica os metadados de todas as tabelas
+
+
+def _warm_embedder():
+    embedder.encode([WARMUP_TEXT])
+
+
+def _warm_classifier():
+    clf = load_classifier()  # também carrega o MiniLM do classificador
+    if clf is None:
+        return "classificador não treinado"
+
+    clf.predict_batch([WARMUP_TEXT], top_k=1)
+
+
+WARMUP_STEPS = [
+    ("chroma", "retrieval", _warm_chroma),
+    ("embedder", "retrieval", _warm_embedder),
+    ("classifier", "retrieval", _warm_classifier),
+    ("llama", None, awarmup_llama),  # assíncrono: roda no próprio loop
+]
+
+
+async def _run_step(name, stage, fn):
+    start = time.perf_counter()
+    try:
+        if stage is None:
+            note = await fn()
+        else:
+            note = await run_in_stage(stage, fn)
+        _state["steps"][name] = {
+            "ok": True,
+            "seconds": round(time.perf_counter() - start, 3),
+            "note": note
+        }
+        print(f"🔥 Aquecimento '{name}' concluído em {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        _state["steps"][name] = {
+            "ok": False,
+            "seconds": round(time.perf_counter() - start, 3),
+            "error": str(e)
+        }
+        print(f"[WARN] Aquecimento '{name}' falhou: {e}")
+
+
+async def run_warmup():
+    """
+    Executa as etapas em paralelo e repete as que falharam (ex.: Ollama
+    ainda subindo) a cada settings.warmup_retry_interval segundos.
+    """
+    _state["started_at"] = time.time()
+    pending = list(WARMUP_STEPS)
+
+    while pending:
+        await asyncio.gather(*(_run_step(*step) for step in pending))
+        pending = [step for step in pending if not _state["steps"][step[0]]["ok"]]
+
+        if pending:
+            await asyncio.sleep(settings.warmup_retry_interval)
+
+    _state["ready"] = True
+    _state["finished_at"] = time.time()
+    print(f"✅ Instância aquecida em {_state['finished_at'] - _state['started_at']:.1f}s")
+
+
+def mark_ready():
+    """Usado quando o aquecimento está desligado (WARMUP_ENABLED=0)."""
+    _state["ready"] = True
+
+
+def is_ready() -> bool:
+    return _state["ready"]
+
+
+def warmup_status() -> dict:
+    return {
+        "ready": _state["ready"],
+        "steps": dict(_state["steps"])
+    }
@@ -1,9 +1,9 @@
 import os
 import joblib
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import LabelEncoder
+from app.core.models import get_classifier_embedder, encode_cached, CLASSIFIER_EMBED_MODEL
 
 
 # Caminho do modelo
@@ -19,8 +19,8 @@ class TableClassifier:
         self.model = None
         self.label_encoder = None
 
-        # Embedder para classificação
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
+        # Embedder para classificação (compartilhado pelo registro de modelos)
+        self.embedder = get_classifier_embedder()
 
         # Carregar modelo se existir
         if os.path.exists(self.model_path):
@@ -73,23 +73,38 @@ class TableClassifier:
         """
         Retorna top_k tabelas mais prováveis baseado na pergunta.
         """
+        return self.predict_batch([question], top_k=top_k)[0]
+
+    def predict_batch(self, questions, top_k=5):
+        """
+        Versão em lote: um único encode e um único predict_proba.
+        Retorna uma lista de predições por pergunta.
+        """
 
         if self.model is None or self.label_encoder is None:
+            return [[] for _ in questions]
+
+        if not questions:
             return []
 
-        x = self.embedder.encode([question], show_progress_bar=False)
+        # perguntas repetidas não são recodificadas (cache LRU do registro)
+        x = encode_cached(CLASSIFIER_EMBED_MODEL, questions)
 
         # Distribuição de probabilidade
-        probs = self.model.predict_proba(x)[0]
+        all_probs = self.model.predict_proba(x)
+
+        results = []
+        for probs in all_probs:
+            # Índices ordenados
+            idxs = np.argsort(probs)[::-1][:top_k]
 
-        # Índices ordenados
-        idxs = np.argsort(probs)[::-1][:top_k]
+            # Convertendo para rótulos reais
+            labels = self.label_encoder.inverse_transform(idxs)
+            scores = probs[idxs].tolist()
 
-        # Convertendo para rótulos reais
-        labels = self.label_encoder.inverse_transform(idxs)
-        scores = probs[idxs].tolist()
+            results.append([
+                {"id": lab, "score": float(s)}
+                for lab, s in zip(labels, scores)
+            ])
 
-        return [
-            {"id": lab, "score": float(s)}
-            for lab, s in zip(labels, scores)
-        ]
\ No newline at end of file
+        return results
\ No newline at end of file
@@ -0,0 +1,95 @@
+import os
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.schema_version import get_schema_version
+
+
+# -------------------------------------------
+# EMBEDDINGS DOS NOMES DE COLUNAS (pré-calculados)
+# -------------------------------------------
+# O contexto de schema do prompt do SQL ranqueia as colunas pela
+# similaridade com a pergunta. Os nomes só mudam quando o pipeline roda:
+# o indexer codifica cada nome único uma vez e grava a matriz normalizada.
+# Na consulta não há encode de colunas (nem disputa pelo LRU de perguntas).
+COLUMN_INDEX_FILE = os.path.join(settings.chroma_dir, "column_embeddings.npz")
+
+
+def _column_text(name: str) -> str:
+    # "dt_emissao" -> "dt emissao": o modelo lê as partes como palavras
+    return name.replace("_", " ")
+
+
+def build_column_index(docs, embedder, path=COLUMN_INDEX_FILE) -> int:
+    """
+    Codifica os nomes de colunas únicos (minúsculos) dos documentos e grava
+    o índice. Retorna a quantidade de nomes.
+    """
+    names = list(dict.fromkeys(
+        c["name"].lower()
+        for d in docs
+        for c in d.get("columns", [])
+        if isinstance(c, dict) and isinstance(c.get("name"), str) and c["name"]
+    ))
+
+    if names:
+        matrix = np.asarray(
+            embedder.encode([_column_text(n) for n in names], show_progress_bar=True),
+            dtype=np.float32
+        )
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, names=np.array(names, dtype=str), matrix=matrix)
+    os.replace(tmp, path)  # troca atômica para a API
+
+    return len(names)
+
+
+class ColumnIndex:
+    __slots__ = ("rows", "matrix")
+
+    def __init__(self, names, matrix):
+        self.rows = {n: i for i, n in enumerate(names)}  # nome minúsculo -> linha
+        self.matrix = matrix                              # (n_nomes x dim), linhas normalizadas
+
+    def similarities(self, names: list, q_emb: np.ndarray) -> np.ndarray:
+        """Cosseno de cada coluna com a pergunta (normalizada); NaN para nomes fora do índice."""
+        rows = np.array([self.rows.get(n.lower(), -1) for n in names], dtype=np.int64)
+        sims = np.full(len(names), np.nan, dtype=np.float32)
+
+        known = rows >= 0
+        if known.any():
+            sims[known] = self.matrix[rows[known]] @ q_emb
+        return sims
+
+
+_cache = {"index": None, "version": None}
+_lock = threading.Lock()
+
+
+def load_column_index(path=COLUMN_INDEX_FILE):
+    """Índice em memória (recarregado quando a versão do schema muda); None se não existir."""
+    version = get_schema_version()
+    if _cache["version"] == version:
+        return _cache["index"]
+
+    with _lock:
+        if _cache["version"] != version:
+            index = None
+            try:
+                with np.load(path) as data:
+                    index = ColumnIndex(data["names"].tolist(), data["matrix"])
+            except (OSError, KeyError, ValueError) as e:
+                if os.path.exists(path):
+                    print(f"[WARN] Índice de colunas inválido: {e}")
+
+            _cache["index"] = index
+            _cache["version"] = version
+
+        return _cache["index"]
@@ -1,5 +1,5 @@
-from sentence_transformers import SentenceTransformer
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from app.core.models import LazyModel, CLASSIFIER_EMBED_MODEL
+model = LazyModel(CLASSIFIER_EMBED_MODEL)
 
 def embed_text(text):
  return model.encode([text])[0].tolist()
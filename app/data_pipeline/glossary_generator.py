@@ -2,12 +2,11 @@ from app.core.config import settings
 from sklearn.cluster import KMeans
 from sklearn.metrics import pairwise_distances_argmin_min
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from tqdm import tqdm
+from app.core.models import LazyModel, EMBED_MODEL
 
-EMBED_MODEL = settings.embed_model_path
-embedder = SentenceTransformer(EMBED_MODEL)
+embedder = LazyModel(EMBED_MODEL)
 
 def extract_keywords_tfidf(docs, topk=5):
     texts = [d["text"] for d in docs]
@@ -1,18 +1,26 @@
 from chromadb import PersistentClient
 from app.core.config import settings
-from sentence_transformers import SentenceTransformer
+from app.core.schema_version import bump_schema_version
+from app.core.models import LazyModel, EMBED_MODEL
+from app.data_pipeline.tag_index import build_tag_index
+from app.data_pipeline.column_index import build_column_index
+from app.agents.mapping_agent.vector_index import write_vector_index
+from app.agents.mapping_agent.lexical_index import build_lexical_index
 import json
 
-# Carregado uma única vez
-EMBED_MODEL_PATH = settings.embed_model_path
-embedder = SentenceTransformer(EMBED_MODEL_PATH)
+# Carregado uma única vez (registro compartilhado)
+embedder = LazyModel(EMBED_MODEL)
 
 
-def get_collection():
+SCHEMA_COLLECTION = "db_schema"
+DOCS_COLLECTION = "external_docs"  # documentos externos ficam fora do índice do schema
+
+
+def get_collection(name=SCHEMA_COLLECTION):
     client = PersistentClient(path=settings.chroma_dir)
 
     return client.get_or_create_collection(
-        name="db_schema",
+        name=name,
         metadata={"hnsw:space": "cosine"}
     )
 
@@ -32,7 +40,7 @@ def index_text_documents(docs):
         print("⚠ Nenhum documento externo para indexar.")
         return True
 
-    collection = get_collection()
+    collection = get_collection(DOCS_COLLECTION)
 
     ids = [f"doc:{name}" for name, _ in docs]
     texts = [content for _, content in docs]
@@ -52,6 +60,9 @@ def index_text_documents(docs):
         ]
     )
 
+    # a API recarrega os handles das coleções
+    bump_schema_version()
+
     print(f"📄 Indexação externa concluída: {len(ids)} docs")
     return True
 
@@ -116,6 +127,24 @@ def index_documents(docs):
         metadatas=metadatas
     )
 
+    # Matriz exata para VECTOR_BACKEND=numpy
+    write_vector_index(ids, embeddings)
+
+    # Índice invertido BM25 (nomes de tabela/colunas, tags, glossário)
+    n_lex = build_lexical_index(docs)
+    print(f"🔤 Índice lexical: {n_lex} termos.")
+
+    # Matriz de embeddings das tags/glossário (busca por tags no retriever)
+    n_terms = build_tag_index(docs, embedder)
+    print(f"🏷 {n_terms} tags/termos de glossário pré-codificados.")
+
+    # Nomes de colunas (ranking do contexto de schema no prompt do SQL)
+    n_cols = build_column_index(docs, embedder)
+    print(f"🧱 {n_cols} nomes de colunas pré-codificados.")
+
+    # invalida caches da API (semantic cache etc.)
+    version = bump_schema_version()
+
     print("✅ Indexação completa no ChromaDB.")
-    print(f"📦 {len(ids)} tabelas indexadas.")
+    print(f"📦 {len(ids)} tabelas indexadas (versão do schema {version}).")
     return True
\ No newline at end of file
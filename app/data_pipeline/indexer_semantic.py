@@ -1,10 +1,9 @@
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
+from app.core.models import LazyModel, EMBED_MODEL
 
-EMBED_MODEL_PATH = settings.embed_model_path
-embedder = SentenceTransformer(EMBED_MODEL_PATH)
+embedder = LazyModel(EMBED_MODEL)
 
 
 def index_documents_with_tags(docs):
@@ -48,11 +48,12 @@ def main():
         import chromadb
 
         client = chromadb.PersistentClient(path=settings.chroma_dir)
-        try:
-            client.delete_collection("db_schema")
-            print("✔ Coleção antiga 'db_schema' removida.")
-        except:
-            print("ℹ Coleção 'db_schema' não existia.")
+        for name in ("db_schema", "external_docs"):
+            try:
+                client.delete_collection(name)
+                print(f"✔ Coleção antiga '{name}' removida.")
+            except:
+                print(f"ℹ Coleção '{name}' não existia.")
 
     except Exception as e:
         print(f"⚠ Falha ao acessar ChromaDB: {e}")
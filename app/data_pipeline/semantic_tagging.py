@@ -1,11 +1,10 @@
 # app/data_pipeline/semantic_tagging.py
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from app.core.config import settings
+from app.core.models import LazyModel, EMBED_MODEL
 
-# Caminho do modelo
-EMBED_MODEL_PATH = settings.embed_model_path
-embedder = SentenceTransformer(EMBED_MODEL_PATH)
+# Modelo compartilhado (carregado no primeiro uso)
+embedder = LazyModel(EMBED_MODEL)
 
 # Conceitos principais
 CONCEPTS = {
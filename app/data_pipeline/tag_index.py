@@ -0,0 +1,124 @@
+import os
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.schema_version import get_schema_version
+
+
+# -------------------------------------------
+# EMBEDDINGS DE TAGS E GLOSSÁRIO (pré-calculados)
+# -------------------------------------------
+# Tags e termos de glossário só mudam quando o pipeline roda. O indexer
+# codifica todos uma única vez e grava uma matriz normalizada (um termo
+# por linha) + os índices dos termos de cada tabela. Na consulta, pontuar
+# a pergunta contra todas as tabelas é um único produto matriz–vetor.
+TAG_INDEX_FILE = os.path.join(settings.chroma_dir, "tag_embeddings.npz")
+
+
+def _table_terms(doc: dict) -> list:
+    terms = list(doc.get("tags") or []) + list(doc.get("glossary") or [])
+    return [str(t).strip() for t in terms if isinstance(t, str) and t.strip()]
+
+
+def build_tag_index(docs, embedder, path=TAG_INDEX_FILE) -> int:
+    """
+    Codifica as tags/termos únicos dos documentos e grava o índice.
+    Retorna a quantidade de termos.
+    """
+    terms = {}
+    table_ids, offsets, term_idx = [], [0], []
+
+    for d in docs:
+        for t in dict.fromkeys(_table_terms(d)):
+            term_idx.append(terms.setdefault(t, len(terms)))
+        table_ids.append(d["id"])
+        offsets.append(len(term_idx))
+
+    names = list(terms)
+    if names:
+        matrix = np.asarray(embedder.encode(names, show_progress_bar=True), dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            terms=np.array(names, dtype=str),
+            matrix=matrix,
+            table_ids=np.array(table_ids, dtype=str),
+            offsets=np.array(offsets, dtype=np.int64),
+            term_idx=np.array(term_idx, dtype=np.int64)
+        )
+    os.replace(tmp, path)  # troca atômica para a API
+
+    return len(names)
+
+
+class TagIndex:
+    __slots__ = ("terms", "matrix", "ids", "starts", "term_idx")
+
+    def __init__(self, names, matrix, table_ids, offsets, term_idx):
+        self.terms = {t: i for i, t in enumerate(names)}  # termo -> linha da matriz
+        self.matrix = matrix                               # (n_termos x dim), linhas normalizadas
+        self.term_idx = term_idx                           # linhas dos termos, tabela após tabela
+
+        # só tabelas com termos; segmento de cada uma em term_idx começa em starts[i]
+        offsets = np.asarray(offsets, dtype=np.int64)
+        nonempty = offsets[:-1] < offsets[1:]
+        self.ids = [tid for tid, keep in zip(table_ids, nonempty) if keep]
+        self.starts = offsets[:-1][nonempty]
+
+    def rank_tables(self, q_embs: np.ndarray, top_k: int = 10) -> list:
+        """
+        Para cada pergunta (linhas normalizadas de q_embs), as top_k tabelas
+        pela maior similaridade entre a pergunta e os termos da tabela:
+        [[(id, score), ...], ...]. Um produto matriz–matriz para o lote.
+        """
+        if not self.ids:
+            return [[] for _ in range(len(q_embs))]
+
+        sims = self.matrix @ np.asarray(q_embs, dtype=self.matrix.dtype).T   # (n_termos x n_perguntas)
+        best = np.maximum.reduceat(sims[self.term_idx], self.starts, axis=0)  # (n_tabelas x n_perguntas)
+
+        out = []
+        for qi in range(best.shape[1]):
+            scores = best[:, qi]
+            top = np.argsort(-scores)[:top_k]
+            out.append([(self.ids[i], float(scores[i])) for i in top])
+        return out
+
+
+_cache = {"index": None, "version": None}
+_lock = threading.Lock()
+
+
+def load_tag_index(path=TAG_INDEX_FILE):
+    """Índice em memória (recarregado quando a versão do schema muda); None se não existir."""
+    version = get_schema_version()
+    if _cache["version"] == version:
+        return _cache["index"]
+
+    with _lock:
+        if _cache["version"] != version:
+            index = None
+            try:
+                with np.load(path) as data:
+                    index = TagIndex(
+                        data["terms"].tolist(),
+                        data["matrix"],
+                        data["table_ids"].tolist(),
+                        data["offsets"],
+                        data["term_idx"]
+                    )
+            except (OSError, KeyError, ValueError) as e:
+                if os.path.exists(path):
+                    print(f"[WARN] Índice de tags inválido: {e}")
+
+            _cache["index"] = index
+            _cache["version"] = version
+
+        return _cache["index"]
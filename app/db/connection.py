@@ -1,43 +1,165 @@
-import psycopg2
-from psycopg2.pool import ThreadedConnectionPool
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+
+from psycopg_pool import AsyncConnectionPool
 from app.core.config import settings
+from app.db.guards import ensure_limit, cancel_running_query
 
-# --- Connection Pool Global ---
+# --- Connection Pool Global (psycopg 3, assíncrono) ---
 pool = None
 
-def init_connection_pool():
+
+async def init_connection_pool():
     global pool
 
     if pool is None:
         try:
-            pool = ThreadedConnectionPool(
-                minconn=1,
-                maxconn=10,  # ajuste conforme necessidade
-                dsn=settings.database_url
+            pool = AsyncConnectionPool(
+                conninfo=settings.database_url,
+                min_size=settings.db_pool_min,
+                max_size=settings.db_pool_max,
+                timeout=settings.db_pool_timeout,  # espera máxima por uma conexão livre
+                check=AsyncConnectionPool.check_connection,  # health check no checkout
+                name="query-pool",
+                open=False
             )
+            await pool.open(wait=True, timeout=settings.db_pool_timeout)
             print("🔌 PostgreSQL pool inicializado.")
         except Exception as e:
             print("❌ Erro ao inicializar o pool do PostgreSQL:", e)
+            pool = None
             raise e
 
 
-def get_connection():
-    """Retorna uma conexão do pool."""
+async def close_connection_pool():
+    global pool
+
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+@asynccontextmanager
+async def connection():
+    """
+    Empresta uma conexão do pool e a devolve ao sair do bloco
+    (commit no sucesso, rollback em erro).
+    """
     if pool is None:
-        init_connection_pool()
-
-    try:
-        conn = pool.getconn()
-        return conn
-    except Exception as e:
-        print("❌ Erro ao obter conexão:", e)
-        raise e
-
-
-def release_connection(conn):
-    """Devolve a conexão ao pool."""
-    try:
-        if pool and conn:
-            pool.putconn(conn)
-    except Exception as e:
-        print("❌ Erro ao devolver conexão ao pool:", e)
\ No newline at end of file
+        await init_connection_pool()
+
+    async with pool.connection() as conn:
+        yield conn
+
+
+def pool_stats() -> dict:
+    """Métricas do pool: em uso, livres, aguardando e conexões criadas."""
+    if pool is None:
+        return {"status": "closed"}
+
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+
+    return {
+        "status": "open",
+        "min_size": stats.get("pool_min"),
+        "max_size": stats.get("pool_max"),
+        "size": size,
+        "in_use": size - available,
+        "available": available,
+        "waiting": stats.get("requests_waiting", 0),
+        "created": stats.get("connections_num", 0),
+        "lost": stats.get("connections_lost", 0),
+        "requests": stats.get("requests_num", 0),
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+        "wait_ms": stats.get("requests_wait_ms", 0),
+        "usage_ms": stats.get("usage_ms", 0)
+    }
+
+
+async def stream_sql(sql, offset=0, limit=None, cap=None):
+    """
+    Executa o SQL num cursor nomeado (server-side) e gera, em ordem:
+      ("columns", [nomes]), ("rows", lote)..., ("more", bool)
+    Lê no máximo `limit` linhas a partir de `offset`, em lotes de
+    settings.sql_fetch_batch via fetchmany — nada é materializado inteiro.
+
+    Proteções: transação somente leitura, statement_timeout próprio,
+    LIMIT externo automático (`cap`, padrão settings.sql_auto_limit) e
+    cancelamento da consulta no servidor se a task for cancelada (cliente
+    desconectou ou prazo da requisição expirou).
+
+    Nenhuma linha além de `cap` é devolvida; o LIMIT usa cap + 1 para que
+    ("more", True) na última página permitida indique que o resultado foi
+    cortado no teto.
+    """
+    limit = settings.sql_max_rows if limit is None else limit
+    cap = settings.sql_auto_limit if cap is None else cap
+    batch_size = max(1, settings.sql_fetch_batch)
+
+    if cap:
+        limit = min(limit, max(0, cap - offset))
+
+    # sem o ';' final: DECLARE ... CURSOR FOR <sql> não o aceita
+    sql = ensure_limit(sql, cap + 1 if cap else 0)
+
+    async with connection() as conn:
+        # primeira instrução da transação (o psycopg abre o BEGIN)
+        await conn.execute("SET TRANSACTION READ ONLY")
+        await conn.execute(
+            "SELECT set_config('statement_timeout', %s, true)",
+            (str(settings.sql_statement_timeout_ms),)
+        )
+
+        try:
+            async with conn.cursor(name=f"q_{uuid.uuid4().hex}") as cur:
+                await cur.execute(sql)
+
+                # pula as páginas anteriores no servidor (MOVE), sem trafegar linhas
+                if offset:
+                    await cur.scroll(offset)
+
+                yield "columns", [d.name for d in cur.description] if cur.description else []
+
+                # limit + 1: a linha extra só indica se existe próxima página
+                batch = await cur.fetchmany(min(batch_size, limit + 1))
+
+                sent = 0
+                while batch:
+                    take = batch[:limit - sent]
+                    if take:
+                        yield "rows", take
+                        sent += len(take)
+
+                    if sent >= limit:
+                        yield "more", len(batch) > len(take) or bool(await cur.fetchmany(1))
+                        return
+
+                    batch = await cur.fetchmany(min(batch_size, limit + 1 - sent))
+
+                yield "more", False
+
+        except asyncio.CancelledError:
+            await cancel_running_query(conn)
+            raise
+
+
+async def execute_sql(sql, offset=0, limit=None, cap=None):
+    """
+    Executa o SQL e retorna (colunas, linhas, has_more), limitado a uma
+    página de `limit` linhas (padrão settings.sql_max_rows).
+    """
+    cols, rows, has_more = [], [], False
+
+    async for kind, value in stream_sql(sql, offset=offset, limit=limit, cap=cap):
+        if kind == "columns":
+            cols = value
+        elif kind == "rows":
+            rows.extend(value)
+        else:
+            has_more = value
+
+    return cols, rows, has_more
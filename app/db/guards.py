@@ -0,0 +1,81 @@
+import re
+
+from psycopg import pq
+
+
+# -------------------------------------------
+# LIMIT EXTERNO AUTOMÁTICO
+# -------------------------------------------
+_TRAILING_LIMIT = re.compile(
+    r"\blimit\s+(\d+|all)(\s+offset\s+\d+)?\s*$"
+    r"|\bfetch\s+(?:first|next)\s+(\d+)\s+rows?\s+only\s*$",
+    re.IGNORECASE
+)
+
+
+def ensure_limit(sql: str, max_rows: int) -> str:
+    """
+    Garante um LIMIT de no máximo max_rows no nível externo do SQL.
+    Se o SQL já termina com LIMIT/FETCH FIRST dentro do teto, fica como está;
+    senão é embrulhado em SELECT * FROM (...) LIMIT max_rows.
+    Retorna o SQL sem o ';' final (pronto para DECLARE CURSOR).
+    """
+    body = sql.strip().rstrip(";").strip()
+
+    if not max_rows:
+        return body
+
+    m = _TRAILING_LIMIT.search(body)
+    if m:
+        n = m.group(1) or m.group(3)
+        if n.isdigit() and int(n) <= max_rows:
+            return body
+
+    return f"SELECT * FROM ({body}) AS _limited LIMIT {int(max_rows)}"
+
+
+# -------------------------------------------
+# ORDEM ESTÁVEL (paginação)
+# -------------------------------------------
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_ORDER_TOKENS = re.compile(r"\(|\)|\border\s+by\b", re.IGNORECASE)
+
+
+def has_order_by(sql: str) -> bool:
+    """
+    True se o SQL tem ORDER BY no nível externo (fora de parênteses e
+    literais; o ORDER BY de OVER (...) ou de subconsultas não conta).
+    Sem ele o PostgreSQL não garante a mesma ordem entre execuções, e
+    páginas por offset podem repetir ou pular linhas.
+    """
+    depth = 0
+    for m in _ORDER_TOKENS.finditer(_STRING.sub("''", sql or "")):
+        tok = m.group(0)
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+        elif depth == 0:
+            return True
+    return False
+
+
+# -------------------------------------------
+# CANCELAMENTO NO SERVIDOR
+# -------------------------------------------
+async def cancel_running_query(conn):
+    """
+    Pede ao PostgreSQL para cancelar a consulta em andamento na conexão
+    (equivalente a pg_cancel_backend). Só age se houver consulta ativa.
+    """
+    try:
+        if conn.pgconn.transaction_status != pq.TransactionStatus.ACTIVE:
+            return
+
+        if hasattr(conn, "cancel_safe"):
+            await conn.cancel_safe()
+        else:
+            conn.cancel()
+        print("[DB] Consulta cancelada no servidor.")
+    except Exception as e:
+        print(f"[WARN] Falha ao cancelar consulta: {e}")
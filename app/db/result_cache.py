@@ -0,0 +1,366 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.core.schema_version import get_schema_version
+
+
+# -------------------------------------------
+# NORMALIZAÇÃO DO SQL (chave do cache)
+# -------------------------------------------
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_TOKEN = re.compile(r'"(?:[^"]|"")*"|[A-Za-z_][A-Za-z0-9_$]*|\S')
+
+# palavras antes de "(" que NÃO são chamadas de função (subconsulta/grupo)
+_NOT_FUNCTIONS = {
+    "in", "exists", "from", "join", "as", "select", "where", "and", "or",
+    "not", "on", "union", "all", "any", "some", "lateral", "values", "with",
+    "when", "then", "else", "having", "using", "by", "intersect", "except"
+}
+# cláusulas que encerram a lista de tabelas do FROM
+_FROM_END = {
+    "where", "group", "order", "having", "limit", "offset", "union",
+    "intersect", "except", "window", "fetch", "for", "returning", "select"
+}
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Minúsculas e espaços colapsados fora de literais; remove o ';' final.
+    Literais entre aspas são preservados (o valor faz parte da consulta).
+    """
+    parts = _QUOTED.split((sql or "").strip().rstrip(";").strip())
+
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2:  # literal entre aspas
+            out.append(part)
+        else:
+            out.append(re.sub(r"\s+", " ", part).lower())
+
+    return "".join(out).strip()
+
+
+def qualify_table(name: str) -> str:
+    """'Tabela' ou 'schema.tabela' → 'schema.tabela' (schema padrão das settings)."""
+    name = name.replace('"', "").strip().lower()
+    if "." not in name:
+        name = f"{settings.schema.lower()}.{name}"
+    return name
+
+
+def _is_identifier(tok: str) -> bool:
+    return tok[0] == '"' or tok[0].isalpha() or tok[0] == "_"
+
+
+def referenced_tables(sql: str) -> set:
+    """
+    Tabelas citadas em FROM/JOIN: aceita identificadores entre aspas
+    duplas, listas separadas por vírgula (FROM a, b) e subconsultas, e
+    ignora o "from" de chamadas de função (extract(year from dt)).
+    Só literais entre aspas simples são descartados.
+    """
+    tokens = _TOKEN.findall(_STRING.sub("''", sql or ""))
+    tables = set()
+
+    stack = []         # "func" ou "group" para cada "(" aberto
+    from_depths = []   # profundidades das listas de FROM abertas (subconsultas empilham)
+    expect = False     # próximo identificador é um nome de tabela
+    prev = ""
+
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        low = tok.lower()
+        in_function = bool(stack) and stack[-1] == "func"
+
+        if tok == "(":
+            is_call = _is_identifier(prev) and prev.lower() not in _NOT_FUNCTIONS
+            stack.append("func" if is_call else "group")
+            expect = False
+        elif tok == ")":
+            if stack:
+                stack.pop()
+            # fim da subconsulta: volta para a lista de FROM externa
+            while from_depths and from_depths[-1] > len(stack):
+                from_depths.pop()
+        elif in_function:
+            pass
+        elif low in ("from", "join"):
+            expect = True
+            if low == "from" and not (from_depths and from_depths[-1] == len(stack)):
+                from_depths.append(len(stack))
+        elif tok == "," and from_depths and from_depths[-1] == len(stack):
+            expect = True
+        elif low in _FROM_END and from_depths and from_depths[-1] == len(stack):
+            from_depths.pop()
+        elif expect and low in ("only", "lateral"):
+            pass
+        elif expect and _is_identifier(tok):
+            # nome qualificado: a . b
+            name = [tok]
+            while i + 2 < len(tokens) and tokens[i + 1] == "." and _is_identifier(tokens[i + 2]):
+                name.append(tokens[i + 2])
+                i += 2
+            expect = False
+            # função no FROM (generate_series(...)) não é tabela
+            if not (i + 1 < len(tokens) and tokens[i + 1] == "("):
+                tables.add(qualify_table(".".join(name)))
+            tok = name[-1]
+        else:
+            expect = False
+
+        prev = tok
+        i += 1
+
+    return tables
+
+
+# contador "global": invalidate() sem tabelas incrementa este
+ALL_TABLES = "*"
+
+
+def _estimate_size(columns, rows) -> int:
+    """Estimativa rasa (bytes) de colunas + linhas para o limite de memória."""
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(c) for c in columns)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return size
+
+
+# -------------------------------------------
+# VERSÕES DAS TABELAS (compartilhadas entre workers)
+# -------------------------------------------
+# Com vários workers do uvicorn, o /cache/sql/invalidate chega a um só
+# processo. Os contadores ficam num SQLite (WAL) ao lado do Chroma: o
+# incremento é atômico e cada worker relê a tabela no máximo a cada
+# settings.sql_cache_version_poll segundos.
+class TableVersions:
+    def __init__(self, path, poll=1.0):
+        self.path = path
+        self.poll = poll
+        self._local = threading.local()  # uma conexão sqlite por thread
+        self._versions = {}
+        self._read_at = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS table_versions ("
+                "name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def current(self, force=False) -> dict:
+        """{tabela: contador}; relido do SQLite quando o poll expira (ou force)."""
+        now = time.monotonic()
+        if force or now - self._read_at >= self.poll:
+            try:
+                rows = self._conn().execute("SELECT name, version FROM table_versions").fetchall()
+                self._versions = dict(rows)
+                self._read_at = now
+            except sqlite3.Error as e:
+                print(f"[WARN] Versões do cache SQL indisponíveis: {e}")
+        return self._versions
+
+    def bump(self, tables) -> dict:
+        try:
+            conn = self._conn()
+            conn.executemany(
+                "INSERT INTO table_versions (name, version) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+                [(t,) for t in tables]
+            )
+        except sqlite3.Error as e:
+            print(f"[WARN] Falha ao propagar invalidação do cache SQL: {e}")
+            for t in tables:
+                self._versions[t] = self._versions.get(t, 0) + 1
+            return self._versions
+        return self.current(force=True)
+
+
+# -------------------------------------------
+# CACHE DE RESULTADOS SQL
+# -------------------------------------------
+class SQLResultCache:
+    """
+    Cache (colunas, linhas) por SQL normalizado e offset da página.
+
+    - TTL por entrada;
+    - LRU limitado por memória estimada (max_bytes);
+    - invalidação por tabela: cada tabela tem um contador de versão e a
+      entrada guarda as versões das tabelas que leu. invalidate(["cliente"])
+      incrementa o contador e descarta as entradas afetadas. Com `versions`
+      (TableVersions) os contadores valem para todos os workers; sem ele,
+      só para o processo.
+    """
+
+    def __init__(self, ttl=300, max_bytes=256 * 1024 * 1024, versions=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()  # (sql normalizado, offset) -> entrada
+        self._table_versions = {}      # schema.tabela -> contador
+        self._shared = versions
+        self._bytes = 0
+        self._version = get_schema_version()
+        self._lock = threading.Lock()
+
+    # ---------------------------
+    # Internos (sob lock)
+    # ---------------------------
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def _check_version(self):
+        version = get_schema_version()
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def _versions(self) -> dict:
+        if self._shared is not None:
+            self._table_versions = self._shared.current()
+        return self._table_versions
+
+    def _bump(self, tables):
+        if self._shared is not None:
+            self._table_versions = self._shared.bump(tables)
+            return
+        for t in tables:
+            self._table_versions[t] = self._table_versions.get(t, 0) + 1
+
+    def _is_stale(self, entry, now) -> bool:
+        if now - entry["created"] > self.ttl:
+            return True
+        versions = self._versions()
+        return any(
+            versions.get(t, 0) != v
+            for t, v in entry["tables"].items()
+        )
+
+    # ---------------------------
+    # API pública
+    # ---------------------------
+    def get(self, sql: str, offset: int = 0):
+        """Retorna (colunas, linhas, has_more) da página ou None."""
+        key = (normalize_sql(sql), offset)
+        now = time.time()
+
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if self._is_stale(entry, now):
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["columns"], entry["rows"], entry["has_more"]
+
+    def snapshot(self, sql: str) -> dict:
+        """
+        Versões atuais das tabelas do SQL. Capturar ANTES de executar e
+        passar ao put(): se houver invalidação durante a execução, a
+        entrada já nasce obsoleta.
+        """
+        tables = referenced_tables(sql) | {ALL_TABLES}
+        with self._lock:
+            versions = self._versions()
+            return {t: versions.get(t, 0) for t in tables}
+
+    def is_current(self, snapshot: dict) -> bool:
+        """True se nenhuma tabela do snapshot foi invalidada desde que ele foi tirado."""
+        with self._lock:
+            versions = self._versions()
+            return all(versions.get(t, 0) == v for t, v in snapshot.items())
+
+    def put(self, sql: str, columns, rows, has_more=False, offset: int = 0, snapshot=None):
+        key = (normalize_sql(sql), offset)
+        size = _estimate_size(columns, rows)
+
+        # resultado maior que o cache inteiro: não guarda
+        if size > self.max_bytes:
+            return
+
+        if snapshot is None:
+            snapshot = self.snapshot(sql)
+
+        with self._lock:
+            self._check_version()
+
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = {
+                "columns": list(columns),
+                "rows": rows,
+                "has_more": has_more,
+                "tables": snapshot,
+                "created": time.time(),
+                "size": size
+            }
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tables=None) -> int:
+        """
+        Invalida as entradas que leem alguma das tabelas (todas se None/vazio).
+        Retorna quantas entradas foram removidas.
+        """
+        with self._lock:
+            if not tables:
+                self._bump([ALL_TABLES])
+                removed = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return removed
+
+            targets = {qualify_table(t) for t in tables}
+            self._bump(sorted(targets))
+
+            stale = [k for k, e in self._entries.items() if targets & e["tables"].keys()]
+            for k in stale:
+                self._drop(k)
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+result_cache = SQLResultCache(
+    ttl=settings.sql_cache_ttl,
+    max_bytes=settings.sql_cache_max_mb * 1024 * 1024,
+    versions=TableVersions(settings.sql_cache_versions_path, poll=settings.sql_cache_version_poll)
+)
@@ -1,8 +1,16 @@
-from fastapi import FastAPI
+import time
+import asyncio
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.routes import router
-from app.db.connection import init_connection_pool, pool
+from app.db.connection import init_connection_pool, close_connection_pool
+from app.core.concurrency import shutdown_executors
+from app.agents.llm.ollama_client import close_client
+from app.core.metrics import start_request_timings, server_timing_header
+from app.core.config import settings
+from app.core.warmup import run_warmup, mark_ready
 
 app = FastAPI(
     title="Inteligência Personalizada",
@@ -12,19 +20,45 @@ app = FastAPI(
 
 # --- Inicializar Pool no Startup ---
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     print("🚀 Iniciando API...")
-    init_connection_pool()
+    await init_connection_pool()
     print("🔌 Pool de conexões pronto.")
 
+    # aquecimento em background: a API sobe, mas /ready só fica 200 no fim
+    if settings.warmup_enabled:
+        app.state.warmup_task = asyncio.create_task(run_warmup())
+    else:
+        mark_ready()
+
 
 # --- Encerrar Pool no Shutdown ---
 @app.on_event("shutdown")
-def shutdown_event():
-    if pool:
-        print("🔻 Encerrando pool de conexões...")
-        pool.closeall()
-        print("❌ Pool encerrado com sucesso.")
+async def shutdown_event():
+    warmup_task = getattr(app.state, "warmup_task", None)
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+
+    print("🔻 Encerrando pool de conexões...")
+    await close_connection_pool()
+    print("❌ Pool encerrado com sucesso.")
+    await close_client()
+    shutdown_executors()
+
+
+# --- Server-Timing: tempo de cada etapa no header da resposta ---
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    timings = start_request_timings()
+    start = time.perf_counter()
+
+    response = await call_next(request)
+
+    # em respostas streaming o header sai antes das etapas finais
+    response.headers["Server-Timing"] = server_timing_header(
+        timings, time.perf_counter() - start
+    )
+    return response
 
 
 # --- CORS (caso você use frontend externo) ---
@@ -0,0 +1,63 @@
+# app/tests/test_result_cache.py
+from app.core.config import settings
+from app.db.result_cache import SQLResultCache, referenced_tables
+
+S = settings.schema.lower()
+
+
+def test_quoted_identifier():
+    assert referenced_tables('SELECT * FROM "Cliente"') == {f"{S}.cliente"}
+
+
+def test_comma_join():
+    sql = "SELECT * FROM cliente c, pedido p WHERE c.codcli = p.codcli"
+    assert referenced_tables(sql) == {f"{S}.cliente", f"{S}.pedido"}
+
+
+def test_comma_after_derived_table():
+    sql = "SELECT * FROM (SELECT codcli FROM cliente) c, pedido p WHERE c.codcli = p.codcli"
+    assert referenced_tables(sql) == {f"{S}.cliente", f"{S}.pedido"}
+
+
+def test_from_inside_function():
+    sql = "SELECT extract(year from dt), count(*) FROM pedido GROUP BY 1"
+    assert referenced_tables(sql) == {f"{S}.pedido"}
+
+
+def test_string_literal_ignored():
+    sql = "SELECT * FROM cliente WHERE obs = 'veio from fornecedor'"
+    assert referenced_tables(sql) == {f"{S}.cliente"}
+
+
+def test_invalidate_comma_joined_table():
+    cache = SQLResultCache()
+    sql = "SELECT * FROM cliente, pedido"
+    cache.put(sql, ["a"], [(1,)])
+
+    cache.invalidate(["pedido"])
+    assert cache.get(sql) is None
+
+
+def test_invalidate_table_after_derived_table():
+    cache = SQLResultCache()
+    sql = "SELECT * FROM (SELECT codcli FROM cliente) c, pedido p"
+    cache.put(sql, ["codcli"], [(1,)])
+
+    assert cache.invalidate(["pedido"]) == 1
+    assert cache.get(sql) is None
+
+
+def main():
+    print("=== Teste do cache de resultados SQL ===")
+    test_quoted_identifier()
+    test_comma_join()
+    test_comma_after_derived_table()
+    test_from_inside_function()
+    test_string_literal_ignored()
+    test_invalidate_comma_joined_table()
+    test_invalidate_table_after_derived_table()
+    print("Teste do cache de resultados finalizado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# app/tests/test_semantic_cache.py
+import numpy as np
+
+from app.agents.nlp_agent.nlp_utils import negation_signature, same_negation, literal_signature
+from app.agents.query_agent.semantic_cache import SemanticCache
+
+
+def _vector():
+    # mesmo vetor para as duas perguntas: só a negação pode separá-las
+    v = np.ones(8, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_negation_signature():
+    ativos = negation_signature("listar clientes ativos")
+    assert same_negation(ativos, negation_signature("lista de clientes ativos"))
+    assert not same_negation(ativos, negation_signature("listar clientes inativos"))
+    assert not same_negation(
+        negation_signature("clientes com pedidos"),
+        negation_signature("clientes sem pedidos")
+    )
+    # palavras de negação terminadas em "s"
+    compraram = negation_signature("clientes que compraram")
+    assert not same_negation(compraram, negation_signature("clientes que jamais compraram"))
+    assert not same_negation(
+        negation_signature("vendas de todos os produtos"),
+        negation_signature("vendas de todos os produtos menos bebidas")
+    )
+
+
+def test_literal_signature():
+    assert literal_signature("pedidos do cliente 123") != literal_signature("pedidos do cliente 456")
+    assert literal_signature("vendas de 2023") != literal_signature("vendas de 2024")
+    assert literal_signature("clientes de 'Joinville'") == literal_signature("clientes de 'joinville'")
+
+
+def test_negated_pair_does_not_hit():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("listar clientes ativos", _vector(), {"sql": "SELECT 1;", "rows": [(1,)]})
+
+    assert cache.lookup(_vector(), "listar clientes inativos") is None
+    assert cache.lookup(_vector(), "lista de clientes ativos") is not None
+
+
+def test_different_literal_does_not_hit():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("pedidos do cliente 123", _vector(), {"sql": "SELECT 1;", "rows": [(1,)]})
+
+    assert cache.lookup(_vector(), "pedidos do cliente 456") is None
+    assert cache.lookup(_vector(), "pedidos do cliente 123") is not None
+
+
+def main():
+    print("=== Teste do Semantic Cache ===")
+    test_negation_signature()
+    test_literal_signature()
+    test_negated_pair_does_not_hit()
+    test_different_literal_does_not_hit()
+    print("Teste do semantic cache finalizado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# app/tests/test_tag_search.py
+import numpy as np
+
+from app.data_pipeline.tag_index import TagIndex
+from app.agents.mapping_agent.retriever import fuse_rrf
+
+
+def _tag_index():
+    # termos em eixos ortogonais: "faturamento" só existe em sisplan.nota
+    names = ["cliente", "faturamento", "estoque"]
+    matrix = np.eye(3, dtype=np.float32)
+    table_ids = ["sisplan.cliente", "sisplan.nota", "sisplan.produto"]
+    offsets = [0, 1, 2, 3]
+    term_idx = np.array([0, 1, 2])
+    return TagIndex(names, matrix, table_ids, offsets, term_idx)
+
+
+def test_rank_tables():
+    q = np.array([[0.1, 0.9, 0.0]], dtype=np.float32)
+    ranked = _tag_index().rank_tables(q, top_k=2)[0]
+    assert [tid for tid, _ in ranked] == ["sisplan.nota", "sisplan.cliente"]
+
+
+def test_tags_change_ranking():
+    dense = [
+        {"id": "sisplan.cliente", "score": 0.2},
+        {"id": "sisplan.nota", "score": 0.3},
+    ]
+    # pergunta sobre faturamento: as tags apontam para sisplan.nota
+    tags = _tag_index().rank_tables(np.array([[0.0, 1.0, 0.0]], dtype=np.float32), top_k=1)[0]
+
+    without_tags = fuse_rrf([dict(t) for t in dense], [[]], {}, k=60)
+    with_tags = fuse_rrf([dict(t) for t in dense], [[], tags], {}, k=60)
+
+    assert without_tags[0]["id"] == "sisplan.cliente"
+    assert with_tags[0]["id"] == "sisplan.nota"
+
+
+def main():
+    print("=== Teste da busca por tags ===")
+    test_rank_tables()
+    test_tags_change_ranking()
+    print("Teste da busca por tags finalizado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,27 @@
+import json
+
 import streamlit as st
 import requests
 import pandas as pd
 
-API_URL = "http://localhost:8000/query"
+API_URL = "http://localhost:8000/query/stream"
+
+
+def iter_sse(response):
+    """Lê o stream text/event-stream e devolve pares (evento, dados)."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 
 st.set_page_config(page_title="Inteligência Personalizada", layout="wide")
 
@@ -15,39 +34,81 @@ if st.button("Gerar SQL e Consultar"):
     if not question.strip():
         st.warning("Digite uma pergunta primeiro!")
     else:
-        with st.spinner("Consultando..."):
-            try:
-                response = requests.post(
-                    API_URL,
-                    json={"question": question},
-                    timeout=500
-                )
-            except Exception as e:
-                st.error(f"Erro ao contactar API: {e}")
-                st.stop()
-
-            if response.status_code != 200:
-                st.error(f"Erro: {response.json().get('detail')}")
-                st.stop()
-
-            data = response.json()
-
-            # -------------------------
-            # NOVO: RESPOSTA NATURAL
-            # -------------------------
-            st.subheader("🗣️ Resposta interpretada:")
-            st.success(data.get("answer", "Nenhuma interpretação disponível."))
-
-            st.subheader("📄 SQL Gerado:")
-            st.code(data["sql"], language="sql")
-
-            st.subheader("📊 Resultado:")
-
-            rows = data.get("rows", [])
-            cols = data.get("columns", [])
-
-            if not rows:
-                st.info("Nenhum resultado encontrado.")
-            else:
-                df = pd.DataFrame(rows, columns=cols)
-                st.dataframe(df, use_container_width=True)
\ No newline at end of file
+        status = st.empty()
+        status.info("Consultando...")
+
+        try:
+            response = requests.post(
+                API_URL,
+                json={"question": question},
+                stream=True,
+                timeout=500
+            )
+        except Exception as e:
+            st.error(f"Erro ao contactar API: {e}")
+            st.stop()
+
+        if response.status_code != 200:
+            st.error(f"Erro: {response.json().get('detail')}")
+            st.stop()
+
+        # -------------------------
+        # NOVO: RESPOSTA NATURAL
+        # -------------------------
+        st.subheader("🗣️ Resposta interpretada:")
+        answer_box = st.empty()
+
+        st.subheader("📄 SQL Gerado:")
+        sql_box = st.empty()
+
+        st.subheader("📊 Resultado:")
+        table_box = st.empty()
+
+        answer = ""
+        cols, rows = [], []
+        has_more = False
+        more_info = {}
+
+        for event, data in iter_sse(response):
+            if event == "tables":
+                ids = ", ".join(t["id"] for t in data.get("tables", []) if t.get("id"))
+                status.info(f"Tabelas mapeadas: {ids or '-'}")
+
+            elif event == "sql":
+                sql_box.code(data.get("sql") or "-- sem SQL (resposta por documentos)", language="sql")
+                status.info("Executando SQL...")
+
+            elif event == "columns":
+                cols = data.get("columns", [])
+
+            elif event == "rows":
+                rows.extend(data.get("rows", []))
+                table_box.dataframe(pd.DataFrame(rows, columns=cols), use_container_width=True)
+                status.info("Gerando explicação...")
+
+            elif event == "more":
+                has_more = bool(data.get("has_more", data.get("next_token")))
+                more_info = data
+
+            elif event == "token":
+                answer += data.get("token", "")
+                answer_box.success(answer)
+
+            elif event == "error":
+                st.error(f"Erro: {data.get('detail')}")
+                break
+
+            elif event == "done":
+                break
+
+        status.empty()
+
+        if not answer:
+            answer_box.success("Nenhuma interpretação disponível.")
+        if not rows:
+            table_box.info("Nenhum resultado encontrado.")
+        elif has_more and more_info.get("truncated"):
+            reason = "o SQL não tem ORDER BY" if more_info.get("truncated_reason") == "unordered" else "atingiu o limite de linhas"
+            st.warning(f"Resultado parcial: mostrando {len(rows)} linhas; há mais, mas não é possível paginar ({reason}).")
+        elif has_more:
+            st.caption(f"Mostrando as primeiras {len(rows)} linhas; use /query/page para as demais.")